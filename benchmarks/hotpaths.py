@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+# Times the layout and output hot paths on synthetic pages and compares the
+# results with a stored baseline.
+#
+#   python benchmarks/hotpaths.py [--scale N] [--save FILE] [--compare FILE]
+#
+# Without --save or --compare, results are compared with baseline.json next
+# to this file when it exists. The exit status is 1 when a benchmark is more
+# than --tolerance slower than its baseline.
+
+import os
+import sys
+import json
+import time
+import argparse
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdftable
+import x86manual
+from htmltext import HtmlText, OpenTag, CloseTag
+import synthetic
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# best of repeat runs of function(setup()), setup not timed
+def best_time(function, setup, repeat):
+	best = float("inf")
+	for _ in range(0, repeat):
+		state = setup()
+		start = time.perf_counter()
+		function(state)
+		best = min(best, time.perf_counter() - start)
+	return best
+
+def fed_parser(pages, outputDir):
+	parser = x86manual.x86ManParser(outputDir, None)
+	for page in pages:
+		page.feed(parser)
+	return parser
+
+def html_program(count):
+	program = []
+	for i in range(0, count):
+		program.append(OpenTag("p"))
+		program.append("Paragraph %i has " % i)
+		program.append(OpenTag("strong"))
+		program.append("bold")
+		program.append(CloseTag("strong"))
+		program.append(" and ")
+		program.append(OpenTag("em"))
+		program.append("italic words, then more text.")
+		program.append(CloseTag("em"))
+		program.append(CloseTag("p"))
+	return program
+
+def build_html(program, nested):
+	text = HtmlText()
+	text.append(OpenTag("body"))
+	for i in range(0, len(program), 10):
+		part = HtmlText()
+		for token in program[i:i + 10]:
+			part.append(token)
+		if nested: text.append(part)
+		else:
+			for token in part.tokens: text.append(token)
+	text.append(CloseTag("body"))
+	return text
+
+def run(scale, repeat):
+	pages = synthetic.instruction_pages(scale)
+	line_sets = synthetic.table_line_sets(pages)
+	all_lines = [line for lines in line_sets for line in lines]
+	outputDir = tempfile.mkdtemp(prefix="x86doc-bench-")
+	results = {}
+
+	results["group_rects"] = best_time(lambda lines: pdftable.group_rects(lines), lambda: list(all_lines), repeat)
+	results["Table"] = best_time(lambda sets: [pdftable.Table(lines) for lines in sets], lambda: [list(lines) for lines in line_sets], repeat)
+
+	prepare = lambda parser: parser._x86ManParser__prepare_display()
+	results["prepare_display"] = best_time(prepare, lambda: fed_parser(pages, outputDir), repeat)
+
+	def output_text(state):
+		parser, lines = state
+		for line in lines: parser._x86ManParser__output_text(line)
+	def output_text_setup():
+		parser = x86manual.x86ManParser(outputDir, None)
+		parser._x86ManParser__title_stack = ["addpd", "description"]
+		lines = []
+		for page in pages:
+			for line in page.text_lines:
+				lines.append(x86manual.CharCollection(line, pdftable.Rect(*line.bbox)))
+		return (parser, lines)
+	results["output_text"] = best_time(output_text, output_text_setup, repeat)
+
+	results["HtmlText.append"] = best_time(lambda p: build_html(p, False), lambda: html_program(2000 * scale), repeat)
+	results["HtmlText.append_nested"] = best_time(lambda p: build_html(p, True), lambda: html_program(2000 * scale), repeat)
+	results["HtmlText.to_html"] = best_time(lambda text: text.to_html(), lambda: build_html(html_program(2000 * scale), True), repeat)
+	shutil.rmtree(outputDir)
+	return results
+
+def main(argv):
+	argParser = argparse.ArgumentParser(description="Benchmark pdftable, x86manual and htmltext hot paths.")
+	argParser.add_argument("--scale", type=int, default=1, help="multiplies the amount of synthetic content")
+	argParser.add_argument("--repeat", type=int, default=7, help="runs per benchmark; the best one counts")
+	argParser.add_argument("--save", metavar="FILE", help="store the results as a baseline")
+	argParser.add_argument("--compare", metavar="FILE", help="baseline to compare with (default: %s)" % os.path.basename(BASELINE))
+	argParser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown before a benchmark counts as a regression")
+	args = argParser.parse_args(argv[1:])
+
+	results = run(args.scale, args.repeat)
+
+	if args.save:
+		with open(args.save, "w") as fd:
+			json.dump({"scale": args.scale, "results": results}, fd, indent=1, sort_keys=True)
+			fd.write("\n")
+
+	compare = args.compare
+	if compare == None and not args.save and os.path.exists(BASELINE):
+		compare = BASELINE
+	baseline = {}
+	if compare != None:
+		with open(compare) as fd:
+			stored = json.load(fd)
+		if stored["scale"] != args.scale:
+			print(("%s was recorded at scale %i, not %i" % (compare, stored["scale"], args.scale)))
+			return 1
+		baseline = stored["results"]
+
+	regressions = 0
+	print("%-24s %12s %12s %8s" % ("", "baseline ms", "current ms", "ratio"))
+	for name in sorted(results):
+		current = results[name]
+		if name in baseline:
+			ratio = current / baseline[name]
+			flag = ""
+			if ratio > 1 + args.tolerance:
+				flag = " SLOWER"
+				regressions += 1
+			print("%-24s %12.3f %12.3f %7.2fx%s" % (name, baseline[name] * 1000, current * 1000, ratio, flag))
+		else:
+			print("%-24s %12s %12.3f" % (name, "-", current * 1000))
+	return 1 if regressions > 0 else 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+# Per-object memory and speed of the slot-based core objects, compared with
+# the dict-backed versions they replaced (kept below as references).
+#
+#   python benchmarks/objects.py [count]
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pdftable
+import htmltext
+
+class DictRect(object):
+	def __init__(self, x1, y1, x2, y2):
+		self.__x1 = x1
+		self.__x2 = x2
+		self.__y1 = y1
+		self.__y2 = y2
+	
+	def x1(self): return self.__x1
+	def x2(self): return self.__x2
+	def y1(self): return self.__y1
+	def y2(self): return self.__y2
+	
+	def intersects(self, that, threshold = 2):
+		if self.x1() - that.x2() - threshold > 0:
+			return False
+		if that.x1() - self.x2() - threshold > 0:
+			return False
+		if self.y1() - that.y2() - threshold > 0:
+			return False
+		if that.y1() - self.y2() - threshold > 0:
+			return False
+		return True
+	
+	def contains(self, that):
+		return self.x1() <= that.x1() and self.x2() >= that.x2() and self.y1() <= that.y1() and self.y2() >= that.y2()
+
+class DictOpenTag(object):
+	def __init__(self, tag, coalesce=False, attributes={}, self_closes = False):
+		self.tag = tag
+		self.coalesce = coalesce
+		self.attributes = attributes
+		self.closed_by = None
+		self.self_closes = self_closes
+
+class DictCloseTag(object):
+	def __init__(self, tag):
+		self.closes = None
+		self.tag = tag
+
+def per_object_bytes(factory, count):
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	objects = [factory(i) for i in range(0, count)]
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	# the list holding them costs one pointer per object
+	return (after - before) / float(count) - 8
+
+def seconds(statement, scope, number):
+	return min(timeit.repeat(statement, globals=scope, number=number, repeat=5))
+
+def report(name, before, after):
+	print("%-28s %12.2f %12.2f %9.2fx" % (name, before, after, before / after if after else float("inf")))
+
+def main(argv):
+	count = int(argv[1]) if len(argv) > 1 else 100000
+	print("%-28s %12s %12s %10s" % ("", "dict-backed", "slots", "ratio"))
+	
+	print("bytes per object")
+	report("Rect", per_object_bytes(lambda i: DictRect(1.0, 2.0, 3.0, 4.0), count), per_object_bytes(lambda i: pdftable.Rect(1.0, 2.0, 3.0, 4.0), count))
+	report("OpenTag", per_object_bytes(lambda i: DictOpenTag("p"), count), per_object_bytes(lambda i: htmltext.OpenTag("p"), count))
+	report("CloseTag", per_object_bytes(lambda i: DictCloseTag("p"), count), per_object_bytes(lambda i: htmltext.CloseTag("p"), count))
+	
+	print("seconds per %i operations" % count)
+	scope = {"DictRect": DictRect, "Rect": pdftable.Rect}
+	setup = "a = %s(0, 0, 10, 10); b = %s(5, 5, 20, 20)"
+	exec(setup % ("DictRect", "DictRect"), scope)
+	before = seconds("a.intersects(b); a.contains(b)", scope, count)
+	exec(setup % ("Rect", "Rect"), scope)
+	after = seconds("a.intersects(b); a.contains(b)", scope, count)
+	report("intersects + contains", before, after)
+	
+	before = seconds("DictRect(0, 0, 10, 10)", scope, count)
+	after = seconds("Rect(0, 0, 10, 10)", scope, count)
+	report("Rect()", before, after)
+	
+	tokens = ["text", DictOpenTag("p"), DictCloseTag("p")] * 10
+	scope = {"tokens": tokens, "OpenTag": DictOpenTag, "CloseTag": DictCloseTag}
+	probe = "for t in tokens: hasattr(t, 'tag') and hasattr(t, 'coalesce'); hasattr(t, 'tag') and not hasattr(t, 'coalesce')"
+	before = seconds(probe, scope, count // 10)
+	tokens = ["text", htmltext.OpenTag("p"), htmltext.CloseTag("p")] * 10
+	scope = {"tokens": tokens, "OpenTag": htmltext.OpenTag, "CloseTag": htmltext.CloseTag}
+	after = seconds("for t in tokens: isinstance(t, OpenTag); isinstance(t, CloseTag)", scope, count // 10)
+	report("token kind dispatch", before, after)
+
+if __name__ == "__main__":
+	main(sys.argv)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Synthetic SDM-like pages, built directly as primitives.Page objects: ruled
+# tables (with merged cells), exception tables, figure frames and prose.
+# Coordinates are PDF points on a 612x792 page, like pdfminer gives them.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import primitives
+import pdftable
+
+PAGE_BBOX = (0, 0, 612, 792)
+
+def text_line(x, y, text, font="NeoSansIntel", size=9):
+	chars = []
+	advance = size * 0.5
+	for i in range(0, len(text)):
+		x0 = x + i * advance
+		chars.append(primitives.Char(text[i], "ABCDEF+" + font, (size, 0, 0, size, x0, y), (x0, y, x0 + advance, y + size)))
+	return primitives.TextLine((x, y, x + len(text) * advance, y + size), chars)
+
+def hline(x1, x2, y):
+	return primitives.Shape((x1, y - 0.24, x2, y + 0.24))
+
+def vline(x, y1, y2):
+	return primitives.Shape((x - 0.24, y1, x + 0.24, y2))
+
+# The outline and column borders are drawn as long lines, inner row borders
+# one cell side at a time, as in the manual; Table needs the first line in
+# each direction to span the table. Every merge_every-th inner border is left
+# out, merging the cells on either side.
+def ruled_table(page, left, top, columns, rows, row_height=16, merge_every=0):
+	xs = [left + sum(columns[:i]) for i in range(0, len(columns) + 1)]
+	ys = [top - r * row_height for r in range(0, rows + 1)]
+	border = 0
+	for c in range(0, len(xs)):
+		inner = c != 0 and c != len(xs) - 1
+		start = 0
+		for r in range(0, rows):
+			border += 1
+			if inner and merge_every > 0 and border % merge_every == 0:
+				if r > start: page.rects.append(vline(xs[c], ys[r], ys[start]))
+				start = r + 1
+		if rows > start: page.rects.append(vline(xs[c], ys[rows], ys[start]))
+	page.rects.append(hline(xs[0], xs[-1], ys[0]))
+	for r in range(1, rows):
+		for c in range(0, len(columns)):
+			border += 1
+			if merge_every > 0 and border % (merge_every + 1) == 0: continue
+			page.rects.append(hline(xs[c], xs[c + 1], ys[r]))
+	page.rects.append(hline(xs[0], xs[-1], ys[rows]))
+	for r in range(0, rows):
+		for c in range(0, len(columns)):
+			font = "NeoSansIntelMedium" if r == 0 else "NeoSansIntel"
+			page.text_lines.append(text_line(xs[c] + 2, ys[r] - 12, "cell %i,%i" % (c, r), font, 8))
+	return ys[-1]
+
+def exception_block(page, top, count):
+	page.text_lines.append(text_line(45, top, "Protected Mode Exceptions", "NeoSansIntelMedium", 10))
+	y = top - 14
+	for i in range(0, count):
+		page.text_lines.append(text_line(45, y, "#GP(%i)" % i))
+		page.text_lines.append(text_line(100, y, "If a memory operand effective address is outside the limit."))
+		page.text_lines.append(text_line(100, y - 11, "And if the segment is not writable."))
+		y -= 22
+	return y
+
+def figure(page, x, y, width, height):
+	page.rects.append(primitives.Shape((x, y, x + width, y + height)))
+	page.rects.append(primitives.Shape((x + width - 60, y + 10, x + width - 20, y + 40)))
+	page.text_lines.append(text_line(x + 20, y + height - 20, "Figure text", "Verdana", 8))
+	page.curves.append(primitives.Shape((x + 10, y + 10, x + width - 10, y + height - 10), [(x + 10, y + 10), (x + width / 2, y + height - 10), (x + width - 10, y + 20)]))
+
+def prose(page, top, count):
+	page.text_lines.append(text_line(45, top, "Description", "NeoSansIntelMedium", 10))
+	for i in range(0, count):
+		page.text_lines.append(text_line(50, top - 14 - i * 11, "Synthetic prose line %i that refers to ADDPD and MOVAPS in passing." % i, "Verdana", 9))
+	return top - 14 - count * 11
+
+# The pages of one instruction. scale multiplies the page count; tables have
+# table_rows rows, every merge_every-th border missing.
+def instruction_pages(scale=1, table_rows=20, merge_every=7, title="ADDPD"):
+	pages = []
+	for n in range(0, 4 * scale):
+		page = primitives.Page(PAGE_BBOX)
+		top = 720
+		if n == 0:
+			page.text_lines.append(text_line(45, top, "%s - Synthetic Instruction" % title, "NeoSansIntelMedium", 14))
+			top -= 30
+		kind = n % 4
+		if kind == 0:
+			bottom = ruled_table(page, 46, top, [150, 130, 100, 132], table_rows, merge_every=0)
+			prose(page, bottom - 20, 8)
+		elif kind == 1:
+			bottom = ruled_table(page, 46, top, [60, 60, 60, 60, 60, 60, 60, 92], table_rows, merge_every=merge_every)
+			prose(page, bottom - 20, 6)
+		elif kind == 2:
+			bottom = prose(page, top, 12)
+			exception_block(page, bottom - 20, 8)
+		else:
+			figure(page, 100, 420, 400, 250)
+			prose(page, 400, 20)
+		pages.append(page)
+	return pages
+
+# the thin rects of each page, in the parser's top-down coordinates
+def table_line_sets(pages):
+	sets = []
+	for page in pages:
+		top = page.bbox[3]
+		lines = [pdftable.Rect(s.bbox[0], top - s.bbox[3], s.bbox[2], top - s.bbox[1]) for s in page.rects]
+		lines = [r for r in lines if r.width() < 9 or r.height() < 9]
+		if len(lines) >= 4: sets.append(lines)
+	return sets
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Finds mentions of other instructions in text with one Aho-Corasick automaton
+# over every mnemonic, so a run of text is scanned once however many
+# instructions there are. Matching is case-sensitive (the manual writes
+# mnemonics in capitals) and only whole words are linked.
+
+import collections
+import urllib.parse
+
+def is_word_char(c):
+	return c.isalnum() or c == "_"
+
+# href for the page that x86ManParser writes an instruction to
+def page_href(mnemonic):
+	return urllib.parse.quote("%s.html" % mnemonic.replace("/", ":"))
+
+class Linker(object):
+	# targets maps each name to the href it links to
+	def __init__(self, targets):
+		self.goto = [{}]
+		self.fail = [0]
+		# (length, href) of the name that ends at a state, and the next state
+		# down the failure chain that ends a name
+		self.output = [None]
+		self.next_output = [0]
+		for name, href in targets.items():
+			if len(name) > 0: self.__add(name, href)
+		self.__link_failures()
+
+	def __add(self, name, href):
+		state = 0
+		for c in name:
+			next_state = self.goto[state].get(c)
+			if next_state == None:
+				next_state = len(self.goto)
+				self.goto[state][c] = next_state
+				self.goto.append({})
+				self.fail.append(0)
+				self.output.append(None)
+				self.next_output.append(0)
+			state = next_state
+		self.output[state] = (len(name), href)
+
+	def __link_failures(self):
+		queue = collections.deque(self.goto[0].values())
+		while len(queue) > 0:
+			state = queue.popleft()
+			for c, next_state in self.goto[state].items():
+				queue.append(next_state)
+				fallback = self.fail[state]
+				while fallback != 0 and c not in self.goto[fallback]:
+					fallback = self.fail[fallback]
+				target = self.goto[fallback].get(c, 0)
+				self.fail[next_state] = target if target != next_state else 0
+				self.next_output[next_state] = target if self.output[target] != None else self.next_output[target]
+
+	# (start, end, href) of the mentions in text, leftmost and longest first,
+	# not overlapping; links to skip (the page being written) are left out
+	def links(self, text, skip=None):
+		longest = {}
+		state = 0
+		for i in range(0, len(text)):
+			c = text[i]
+			while state != 0 and c not in self.goto[state]:
+				state = self.fail[state]
+			state = self.goto[state].get(c, 0)
+
+			found = state if self.output[state] != None else self.next_output[state]
+			if found == 0: continue
+			if i + 1 < len(text) and is_word_char(text[i + 1]): continue
+			while found != 0:
+				length, href = self.output[found]
+				start = i + 1 - length
+				if (start == 0 or not is_word_char(text[start - 1])) and href != skip:
+					if start not in longest or longest[start][0] < i + 1:
+						longest[start] = (i + 1, href)
+				found = self.next_output[found]
+
+		result = []
+		end = 0
+		for start in sorted(longest):
+			if start < end: continue
+			end, href = longest[start]
+			result.append((start, end, href))
+		return result
+
+# Linker over the names of every prescan.Section
+def section_linker(sections):
+	targets = {}
+	for section in sections:
+		href = page_href(section.mnemonic())
+		for name in section.names():
+			targets.setdefault(name, href)
+	return Linker(targets)
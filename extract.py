@@ -1,41 +1,295 @@
 #!/usr/bin/env python
 
+import os
 import sys
+import time
+import argparse
+import collections
+import multiprocessing
 from pdfminer.pdfdocument import PDFDocument
 from pdfminer.pdfparser import PDFParser
 from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
 from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
 from pdfminer.layout import LAParams
-from pdfminer.converter import PDFPageAggregator
+import x86manual
 from x86manual import x86ManParser
+from pagedevice import ParserDevice
+import primitives
+import snapshot
+import memory
+import prescan
+import timing
+import instindex
+import opcodetrie
+import crossref
+import sinks
+
+worker_pages__ = None
+worker_resources__ = None
+
+# Pool initializer: a worker opens the document once and keeps its page
+# objects for every task it runs.
+def init_page_worker(path, caching):
+	global worker_pages__, worker_resources__
+	fd = open(path, "rb")
+	document = PDFDocument(PDFParser(fd), caching=caching)
+	worker_pages__ = list(PDFPage.create_pages(document))
+	worker_resources__ = PDFResourceManager(caching=caching)
+
+def extract_pages(job):
+	params, pagenos = job
+	recorder = primitives.PageRecorder()
+	interpreter = PDFPageInterpreter(worker_resources__, ParserDevice(worker_resources__, recorder, params))
+	for i in pagenos:
+		interpreter.process_page(worker_pages__[i])
+	return recorder.pages
+
+def serial_pages(fd, params, pagenos, caching):
+	recorder = primitives.PageRecorder()
+	resMan = PDFResourceManager(caching=caching)
+	interpreter = PDFPageInterpreter(resMan, ParserDevice(resMan, recorder, params))
+	for page in PDFPage.get_pages(fd, pagenos, caching=caching, check_extractable=True):
+		interpreter.process_page(page)
+		yield recorder.pages.pop()
+
+def streamed_pages(fd, params, parser, pagenos, caching):
+	# no copies: the device feeds the parser directly
+	resMan = PDFResourceManager(caching=caching)
+	interpreter = PDFPageInterpreter(resMan, ParserDevice(resMan, parser, params))
+	for page in PDFPage.get_pages(fd, pagenos, caching=caching, check_extractable=True):
+		interpreter.process_page(page)
+		yield page
+
+# Groups of consecutive page numbers that each hold at least chunk pages.
+# Groups never split a section, so a task's pages start on an instruction
+# heading when sections are known.
+def page_chunks(groups, chunk):
+	chunks = []
+	pages = []
+	for group in groups:
+		pages += group
+		if len(pages) >= chunk:
+			chunks.append(pages)
+			pages = []
+	if len(pages) > 0:
+		chunks.append(pages)
+	return chunks
+
+def parallel_pages(path, params, groups, args, caching):
+	# Worker processes are replaced before they handle more than --recycle-after
+	# pages (or one task, if a task is bigger) so that whatever pdfminer
+	# accumulates in them cannot grow without bound. Tasks hold whole
+	# sections, so the largest one sets how many a worker may run.
+	chunks = page_chunks(groups, max(1, args.chunk_size))
+	jobs = [(params, sorted(pages)) for pages in chunks]
+	largest = max([len(pages) for pages in chunks] + [1])
+	pool = multiprocessing.Pool(args.jobs, init_page_worker, (path, caching), maxtasksperchild=max(1, args.recycle_after // largest))
+	# Tasks are handed out two per worker ahead of the one being parsed, so
+	# finished pages cannot pile up here while the parser falls behind.
+	pending = collections.deque()
+	try:
+		for job in jobs:
+			pending.append(pool.apply_async(extract_pages, (job,)))
+			if len(pending) > 2 * args.jobs:
+				for page in pending.popleft().get():
+					yield page
+		while len(pending) > 0:
+			for page in pending.popleft().get():
+				yield page
+		pool.close()
+	finally:
+		pool.terminate()
+		pool.join()
+
+def recorded_pages(pages, path):
+	writer = snapshot.SnapshotWriter()
+	for page in pages:
+		writer.add_page(page)
+		yield page
+	writer.save(path)
+
+def document_sections(path, text_pass, purpose=None):
+	with open(path, "rb") as fd:
+		document = PDFDocument(PDFParser(fd))
+		page_count = resolve1(document.catalog["Pages"])["Count"]
+		return prescan.scan_sections(document, fd, page_count, text_pass, purpose)
 
 def main(argv):
-	for arg in argv[1:]:
-		fd = open(arg)
-		parser = PDFParser(fd)
-		document = PDFDocument(parser)
-		if not document.is_extractable:
-			print("Document not extractable.")
-			return 1
-	
-		params = LAParams(char_margin=1)
-		resMan = PDFResourceManager(caching=True)
-		device = PDFPageAggregator(resMan, laparams=params)
-		interpreter = PDFPageInterpreter(resMan, device)
-		parser = x86ManParser("html", params)
-	
-		i = 1
-		for page in PDFPage.get_pages(fd, set(), caching=True, check_extractable=True):
-			print(("Processing page %i" % i))
-			interpreter.process_page(page)
-			page = device.get_result()
-			parser.process_page(page)
-			i += 1
-		parser.flush()
-		fd.close()
-	
-		print(("Conversion result: %i/%i" % (parser.success, parser.success + parser.fail)))
+	argParser = argparse.ArgumentParser(description="Extract HTML instruction pages from the Intel SDM.")
+	argParser.add_argument("files", nargs="+", metavar="pdf")
+	argParser.add_argument("-j", "--jobs", type=int, default=1, help="number of layout analysis processes")
+	argParser.add_argument("--chunk-size", type=int, default=8, help="pages per worker task")
+	argParser.add_argument("--recycle-after", type=int, default=200, help="pages a worker process handles before it is replaced")
+	argParser.add_argument("--cache", metavar="DIR", help="reuse page snapshots stored in DIR, or create them")
+	argParser.add_argument("--render-jobs", type=int, default=0, help="number of processes that lay out and write finished instructions")
+	argParser.add_argument("--max-memory", type=float, metavar="MB", help="stream pages without pdfminer caches and stop if one instruction grows resident memory by more than MB megabytes")
+	argParser.add_argument("--only", metavar="MNEMONICS", help="comma-separated instructions to extract, e.g. ADDPD,VPERMI2B")
+	argParser.add_argument("--report", metavar="PATH", help="write per-page and per-instruction stage timings to PATH (.json or .csv)")
+	argParser.add_argument("--profile", type=int, default=0, metavar="N", help="with --report, keep cProfile data for the N slowest instructions")
+	argParser.add_argument("--format", choices=["html", "json", "both"], default="html", help="write HTML pages, one NDJSON line per instruction, or both")
+	argParser.add_argument("--index", metavar="PATH", help="add the extracted instructions to the SQLite index at PATH, for query.py")
+	argParser.add_argument("--opcode-trie", metavar="PATH", help="write an opcode lookup file for opcodetrie.OpcodeTrie to PATH")
+	argParser.add_argument("--link", action="store_true", help="link the instructions that each page mentions to their pages")
+	argParser.add_argument("--archive", metavar="PATH", help="append pages to the pack file PATH and its PATH.index instead of writing html/*.html")
+	argParser.add_argument("--write-queue", type=int, default=16, metavar="N", help="pages that may wait for the writer thread")
+	args = argParser.parse_args(argv[1:])
+	timer = timing.Timer(args.profile) if args.report else None
+	formats = ("html", "json") if args.format == "both" else (args.format,)
+	index = instindex.InstructionIndex(args.index) if args.index else None
+	trie = opcodetrie.OpcodeTrieBuilder() if args.opcode_trie else None
+	recordSinks = [sink for sink in (index, trie) if sink != None]
+	pageSink = sinks.ArchiveSink(args.archive) if args.archive else sinks.DirectorySink("html")
+	pageSink = sinks.ThreadedSink(pageSink, max(1, args.write_queue))
+
+	result = 0
+	try:
+		# every document's instructions are known before the first page is written;
+		# with --only, links only go to the pages this run writes
+		known_sections = {}
+		linker = None
+		if args.link:
+			targets = []
+			for arg in args.files:
+				known_sections[arg] = document_sections(arg, True, "find the instructions that --link links to")
+				if args.only:
+					targets += prescan.select_sections(known_sections[arg], args.only.split(","))
+				else:
+					targets += known_sections[arg]
+			linker = crossref.section_linker(targets)
+
+		for arg in args.files:
+			fd = open(arg, "rb")
+			parser = PDFParser(fd)
+			document = PDFDocument(parser)
+			if not document.is_extractable:
+				print("Document not extractable.")
+				fd.close()
+				return 1
+
+			page_count = resolve1(document.catalog["Pages"])["Count"]
+			sections = []
+			if arg in known_sections:
+				sections = known_sections[arg]
+			elif args.only or args.jobs > 1:
+				# reading every page's fonts only pays off when pages get skipped
+				sections = prescan.scan_sections(document, fd, page_count, args.only != None, "find the pages of --only")
+				fd.seek(0)
+
+			pagenos = set()
+			groups = [range(i, i + 1) for i in range(0, page_count)]
+			if args.only:
+				sections = prescan.select_sections(sections, args.only.split(","))
+				if len(sections) == 0:
+					print(("No instruction in %s matches %s" % (arg, args.only)))
+					fd.close()
+					continue
+				groups = [section.pages() for section in sections]
+				for section in sections:
+					pagenos.update(section.pages())
+			elif len(sections) > 0:
+				groups = [range(0, sections[0].first)] + [section.pages() for section in sections]
+
+			params = LAParams(char_margin=1)
+			renderPool = None
+			if args.render_jobs > 0:
+				renderPool = multiprocessing.Pool(args.render_jobs, x86manual.init_render_process, (linker,))
+			budget = None
+			caching = True
+			if args.max_memory != None:
+				budget = memory.MemoryBudget(int(args.max_memory * memory.MEGABYTE))
+				caching = False
+			jsonOutput = None
+			if "json" in formats:
+				jsonPath = "html/%s.ndjson" % os.path.splitext(os.path.basename(arg))[0]
+				print(("Writing instructions to %s" % jsonPath))
+				jsonOutput = open(jsonPath, "w", encoding="UTF-8", newline="\n")
+			parser = x86ManParser("html", params, renderPool=renderPool, memoryBudget=budget, timer=timer,
+				formats=formats, jsonOutput=jsonOutput, recordSinks=recordSinks, linker=linker, sink=pageSink)
+
+			cached = None
+			if args.cache:
+				cachePath = snapshot.snapshot_path(args.cache, snapshot.snapshot_key(arg, params))
+				if os.path.exists(cachePath):
+					print(("Reading pages from %s" % cachePath))
+					cached = snapshot.Snapshot(cachePath)
+
+			if cached != None:
+				if len(pagenos) > 0:
+					pages = (cached.page(i) for i in sorted(pagenos))
+				else:
+					pages = cached.pages()
+			elif args.jobs > 1:
+				pages = parallel_pages(arg, params, groups, args, caching)
+			elif args.cache:
+				pages = serial_pages(fd, params, pagenos, caching)
+			else:
+				pages = streamed_pages(fd, params, parser, pagenos, caching)
+
+			if args.cache and cached == None and len(pagenos) > 0:
+				print("Not writing a snapshot of a partial extraction")
+			elif args.cache and cached == None:
+				os.makedirs(args.cache, exist_ok=True)
+				pages = recorded_pages(pages, cachePath)
+
+			i = 1
+			try:
+				started = time.perf_counter()
+				for page in pages:
+					waited = time.perf_counter() - started
+					print(("Processing page %i" % i))
+					if isinstance(page, primitives.Page):
+						page.feed(parser)
+					if timer != None:
+						timer.interpreted(waited, not isinstance(page, primitives.Page))
+					i += 1
+					started = time.perf_counter()
+			except memory.MemoryBudgetExceeded as e:
+				# the pages written so far still get their timings and lookup files
+				print(("Out of memory budget on page %i: %s" % (i, e)))
+				if renderPool != None:
+					renderPool.terminate()
+					renderPool.join()
+				parser.finish(True)
+				if cached != None: cached.close()
+				if jsonOutput != None: jsonOutput.close()
+				fd.close()
+				result = 1
+				break
+			parser.flush()
+			if timer != None:
+				timer.end_section(parser.section_title())
+			if budget != None:
+				budget.end_section(parser.section_title())
+			try:
+				parser.finish()
+				if renderPool != None: renderPool.close()
+			finally:
+				if renderPool != None:
+					renderPool.terminate()
+					renderPool.join()
+			if cached != None:
+				cached.close()
+			if jsonOutput != None:
+				jsonOutput.close()
+			fd.close()
+
+			print(("Conversion result: %i/%i" % (parser.success, parser.success + parser.fail)))
+			if index != None:
+				index.commit()
+	finally:
+		# whatever stopped the run, the pages and records so far are kept
+		try:
+			pageSink.close()
+		finally:
+			if timer != None:
+				timer.write(args.report)
+			if index != None:
+				index.close()
+			if trie != None:
+				trie.save(args.opcode_trie)
+	return result
 
 if __name__ == "__main__":
 	result = main(sys.argv)
-	sys.exit(result)
\ No newline at end of file
+	sys.exit(result)
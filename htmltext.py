@@ -3,11 +3,16 @@
 # OpenTag and CloseTag are NOT HARDENED against HTML injection!
 # Do not use them for input that you cannot perfectly predict.
 
+import io
 import re
 
-inline_tags__ = set(["em", "strong", "sup", "sub"])
+inline_tags__ = set(["em", "strong", "sup", "sub", "a"])
+text_escapes__ = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+attribute_escapes__ = str.maketrans({"&": "&amp;", '"': "&quot;"})
 
 class OpenTag(object):
+	__slots__ = ("tag", "coalesce", "attributes", "closed_by", "self_closes")
+	
 	def __init__(self, tag, coalesce=False, attributes={}, self_closes = False):
 		self.tag = tag
 		self.coalesce = coalesce
@@ -20,7 +25,7 @@ class OpenTag(object):
 			return ""
 		result = ""
 		for key in self.attributes:
-			result += ' %s="%s"' % (key, str(self.attributes[key]).replace("&", "&amp;").replace('"', '&quot;'))
+			result += ' %s="%s"' % (key, str(self.attributes[key]).translate(attribute_escapes__))
 		return result
 	
 	def open(self):
@@ -33,6 +38,8 @@ class OpenTag(object):
 	def __repr__(self): return "<OpenTag %s %s>" % (self.tag, self.__attribute_string())
 
 class CloseTag(object):
+	__slots__ = ("closes", "tag")
+	
 	def __init__(self, tag):
 		self.closes = None
 		self.tag = tag
@@ -40,96 +47,212 @@ class CloseTag(object):
 	def __str__(self): return "</%s>" % self.tag
 	def __repr__(self): return "<CloseTag %s>" % self.tag
 
+# Appending another HtmlText keeps a reference to it instead of copying its
+# tokens, so self.tokens can hold nested HtmlText objects. Those are never
+# changed afterwards: when coalescing has to edit tokens inside one, the
+# nested objects on the way are copied first, so the same HtmlText can be
+# appended again or used on its own. The tags that are still open and the
+# close tags that end the token list (with the depth the closed tag had in
+# the open tags) are tracked as tokens come in, so neither append nor
+# autoclose has to look back over the tokens.
 class HtmlText(object):
+	__slots__ = ("tokens", "__open", "__trailing_closes", "__mismatch")
+	
 	def __init__(self):
 		self.tokens = []
+		self.__open = []
+		self.__trailing_closes = []
+		self.__mismatch = None
 	
 	def autoclose(self):
-		close_stack = []
-		for t in self.tokens:
-			if self.__is_open(t) and not t.self_closes: close_stack.append(t)
-			elif self.__is_close(t):
-				if not (close_stack[-1].tag == t.tag):
-					print(close_stack)
-					print((self.tokens))
-					raise Exception("autoclose mismatch")
-				close_stack.pop()
-		
-		while len(close_stack) > 0:
-			self.append(CloseTag(close_stack.pop().tag))
+		if self.__mismatch != None:
+			print((self.__mismatch))
+			print((self.tokens))
+			raise Exception("autoclose mismatch")
+		while len(self.__open) > 0:
+			self.append(CloseTag(self.__open[-1].tag))
+	
+	# drops the first and last `count` tokens (usually a wrapping tag pair)
+	def unwrap(self, count=1):
+		del self.tokens[-count:]
+		del self.tokens[:count]
+		self.__trailing_closes = []
+		# the dropped tokens may have opened or closed tags
+		self.__open = []
+		for token in self.flat_tokens():
+			if self.__is_open(token) and not token.self_closes:
+				self.__open.append(token)
+			elif self.__is_close(token):
+				for i in range(len(self.__open) - 1, -1, -1):
+					if self.__open[i].tag == token.tag:
+						del self.__open[i]
+						break
 	
 	def append(self, token):
 		if self.__is_close(token):
-			for prev in reversed(self.tokens):
-				if self.__is_open(prev) and prev.closed_by == None and prev.tag == token.tag:
+			for i in range(len(self.__open) - 1, -1, -1):
+				prev = self.__open[i]
+				if prev.tag == token.tag:
 					token.closes = prev
 					prev.closed_by = token
+					if i != len(self.__open) - 1 and self.__mismatch == None:
+						self.__mismatch = token
+					del self.__open[i]
 					break
 			else:
 				print((self.tokens))
 				raise Exception("No matching OpenTag for %s found!" % token.tag)
-		elif len(self.tokens) > 0 and self.__is_open(token):
-			for i in range(-1, -len(self.tokens), -1):
-				last = self.tokens[i]
-				is_close = self.__is_close(last)
-				if not (is_close or self.__is_open(last)):
-					break
-				if is_close and last.tag == token.tag and last.closes.coalesce and last.closes.attributes == token.attributes:
-					positive = len(self.tokens) + i
-					self.tokens = self.tokens[0:positive] + self.tokens[positive+1:]
+			if prev.coalesce:
+				self.__trailing_closes.append((token, i))
+		elif self.__is_open(token):
+			for last, depth in self.__trailing_closes:
+				if last.tag == token.tag and last.closes.attributes == token.attributes:
+					# reopen the previous element instead of starting a new one,
+					# under the tags opened after it was closed
+					self.__trailing_closes.remove((last, depth))
+					holder, i = self.__own(self.__trailing_path(last))
+					del holder.tokens[i]
+					last.closes.closed_by = None
+					self.__open.insert(min(depth, len(self.__open)), last.closes)
 					return
-		elif hasattr(token, "tokens"):
+			if not token.self_closes:
+				self.__open.append(token)
+		elif isinstance(token, HtmlText):
 			token.autoclose()
-			tokens = token.tokens
-			if len(tokens) > 0:
-				if len(self.tokens) > 0:
-					last = self.tokens[-1]
-					is_close = self.__is_close(last)
-					next = tokens[0]
-					if is_close and self.__is_open(next):
-						closed = last.closes
-						if last.tag == next.tag and closed.coalesce and closed.attributes == next.attributes:
-							self.tokens[-1].closed_by = tokens[-1]
-							self.tokens[-1] = "\n"
-							tokens = tokens[1:]
-				
-				self.tokens += tokens
+			if len(token.tokens) == 0:
+				return
+			
+			if len(self.tokens) > 0:
+				last_path = self.__end_path(-1)
+				last_holder, i = self.__holder(last_path)
+				last = last_holder.tokens[i]
+				first_holder, j = token.__holder(token.__end_path(0))
+				next = first_holder.tokens[j]
+				if self.__is_close(last) and self.__is_open(next):
+					closed = last.closes
+					if last.tag == next.tag and closed.coalesce and closed.attributes == next.attributes:
+						end_holder, k = token.__holder(token.__end_path(-1))
+						closed.closed_by = end_holder.tokens[k]
+						last_holder, i = self.__own(last_path)
+						last_holder.tokens[i] = "\n"
+						token = token.__copy()
+						first_holder, j = token.__own(token.__end_path(0))
+						del first_holder.tokens[j]
+			
+			self.tokens.append(token)
+			# an open tag appended next may still reopen the child's last element
+			base = len(self.__open)
+			self.__trailing_closes = [(last, base + depth) for last, depth in token.__trailing_closes]
 			return
+		else:
+			self.__trailing_closes = []
 		
 		self.tokens.append(token)
 	
+	def __copy(self):
+		copy = HtmlText()
+		copy.tokens = self.tokens[:]
+		copy.__open = self.__open[:]
+		copy.__trailing_closes = self.__trailing_closes[:]
+		copy.__mismatch = self.__mismatch
+		return copy
+	
+	# indexes down nested HtmlText objects to the first (0) or last (-1) token
+	def __end_path(self, end):
+		path = []
+		holder = self
+		while len(holder.tokens) > 0:
+			path.append(end)
+			if not isinstance(holder.tokens[end], HtmlText): break
+			holder = holder.tokens[end]
+		return path
+	
+	# indexes down to token, one of the close tags that end the flattened token
+	# list, or None
+	def __trailing_path(self, token):
+		for i in range(len(self.tokens) - 1, -1, -1):
+			t = self.tokens[i]
+			if t is token: return [i]
+			if isinstance(t, HtmlText):
+				path = t.__trailing_path(token)
+				if path != None: return [i] + path
+			elif not isinstance(t, (OpenTag, CloseTag)):
+				return None
+		return None
+	
+	# (HtmlText, index) of the token at the end of path
+	def __holder(self, path):
+		holder = self
+		for i in path[:-1]:
+			holder = holder.tokens[i]
+		return holder, path[-1]
+	
+	# same, after replacing the nested HtmlText objects on the way with
+	# copies, so that the token can be changed
+	def __own(self, path):
+		holder = self
+		for i in path[:-1]:
+			copy = holder.tokens[i].__copy()
+			holder.tokens[i] = copy
+			holder = copy
+		return holder, path[-1]
+	
+	# every token, with nested HtmlText objects expanded in place
+	def flat_tokens(self):
+		stack = [iter(self.tokens)]
+		while len(stack) > 0:
+			for token in stack[-1]:
+				if isinstance(token, HtmlText):
+					stack.append(iter(token.tokens))
+					break
+				yield token
+			else:
+				stack.pop()
+	
 	def to_html(self):
+		result = io.StringIO()
+		self.write_html(result)
+		return result.getvalue()
+	
+	# Writes to fd in chunks of about chunk_size characters, so the page never
+	# exists as a single string.
+	def write_html(self, fd, chunk_size=1 << 16):
 		tag_stack = []
-		result = ""
-		for token in self.tokens:
+		chunk = []
+		size = 0
+		for token in self.flat_tokens():
 			if isinstance(token, OpenTag):
 				if not token.self_closes:
 					tag_stack.append(token)
-				if not token.tag in inline_tags__: result += "\n"
-				result += token.open()
+				if not token.tag in inline_tags__: chunk.append("\n")
+				piece = token.open()
 			elif isinstance(token, CloseTag):
 				close_it = tag_stack.pop()
 				reopen_it = []
 				while close_it.tag != token.tag:
-					result += close_it.close()
+					chunk.append(close_it.close())
 					reopen_it.append(close_it)
 					close_it = tag_stack.pop()
-				result += close_it.close()
+				piece = close_it.close()
 				for tag in reversed(reopen_it):
 					tag_stack.append(tag)
-					result += tag.open()
+					piece += tag.open()
 			else:
-				uni = str(token)
-				for pair in [("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")]:
-					uni = uni.replace(pair[0], pair[1])
-				result += uni
+				piece = str(token).translate(text_escapes__)
+			
+			chunk.append(piece)
+			size += len(piece)
+			if size >= chunk_size:
+				fd.write("".join(chunk))
+				chunk = []
+				size = 0
 		
 		while len(tag_stack) > 0:
-			result += tag_stack.pop().close()
-		return result
+			chunk.append(tag_stack.pop().close())
+		fd.write("".join(chunk))
 	
 	def __is_open(self, token):
-		return hasattr(token, "tag") and hasattr(token, "coalesce")
+		return isinstance(token, OpenTag)
 	
 	def __is_close(self, token):
-		return hasattr(token, "tag") and not hasattr(token, "coalesce")
\ No newline at end of file
+		return isinstance(token, CloseTag)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+# SQLite index of extracted instructions, filled from the records that
+# x86ManParser writes as NDJSON. Only the standard library is imported here,
+# so that lookups do not pay for pdfminer or the layout modules.
+
+import json
+import pathlib
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instructions (
+	id INTEGER PRIMARY KEY,
+	mnemonic TEXT NOT NULL COLLATE NOCASE,
+	title TEXT NOT NULL,
+	file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS instructions_mnemonic ON instructions (mnemonic);
+CREATE TABLE IF NOT EXISTS names (
+	name TEXT NOT NULL COLLATE NOCASE,
+	instruction INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS names_name ON names (name);
+CREATE TABLE IF NOT EXISTS rows (
+	instruction INTEGER NOT NULL,
+	kind TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	cells TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_instruction ON rows (instruction, kind, position);
+CREATE TABLE IF NOT EXISTS sections (
+	instruction INTEGER NOT NULL,
+	position INTEGER NOT NULL,
+	heading TEXT NOT NULL,
+	text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_instruction ON sections (instruction, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+	mnemonic, kind, heading, text, instruction UNINDEXED
+);
+CREATE TABLE IF NOT EXISTS search_rows (
+	instruction INTEGER PRIMARY KEY,
+	first INTEGER NOT NULL,
+	last INTEGER NOT NULL
+);
+"""
+
+FORM = "form"
+ENCODING = "encoding"
+SECTION = "section"
+TITLE = "title"
+
+def element_text(element):
+	if "runs" in element:
+		return "".join(run["text"] for run in element["runs"]).strip()
+	if element["type"] == "table":
+		return "\n".join(" | ".join(cell) for cell in table_rows(element))
+	if element["type"] == "list":
+		return "\n".join(element_text(item) for item in element["items"] if item != None)
+	if element["type"] == "figure":
+		return " ".join(item["text"] for item in element["items"] if item["type"] == "text")
+	return ""
+
+# the text of each cell, row by row
+def table_rows(table):
+	rows = [[] for i in range(0, table["rows"])]
+	for cell in table["cells"]:
+		rows[cell["row"]].append(" ".join(element_text(e) for e in cell["content"]).strip())
+	return [row for row in rows if len(row) > 0]
+
+# FORM for the instruction table under the title, ENCODING for operand
+# encoding tables, None for anything else
+def table_kind(element, title):
+	if element["type"] != "table": return None
+	section = element.get("section", "")
+	if section == title.lower(): return FORM
+	if section.startswith("instruction operand encoding"): return ENCODING
+	return None
+
+def instruction_names(mnemonic):
+	names = [mnemonic] + [n.strip() for n in mnemonic.replace(",", "/").split("/")]
+	return sorted(set(n for n in names if len(n) > 0))
+
+class InstructionIndex(object):
+	def __init__(self, path):
+		self.db = sqlite3.connect(path)
+		self.db.executescript(SCHEMA)
+
+	# Replaces whatever the index had for the record's instruction.
+	def add(self, record):
+		mnemonic = record["instruction"]
+		self.__remove(mnemonic)
+		cursor = self.db.execute("INSERT INTO instructions (mnemonic, title, file) VALUES (?, ?, ?)",
+			(mnemonic, record["title"], "%s.html" % mnemonic.replace("/", ":")))
+		instruction = cursor.lastrowid
+		self.db.executemany("INSERT INTO names (name, instruction) VALUES (?, ?)",
+			[(name, instruction) for name in instruction_names(mnemonic)])
+
+		search = [(mnemonic, TITLE, "", record["title"], instruction)]
+		rows = []
+		sections = []
+		heading = None
+		text = []
+		for element in record["elements"]:
+			if element["type"] == "heading":
+				if heading != None: sections.append((heading, text))
+				heading = element["text"] if element["level"] > 1 else None
+				text = []
+				continue
+
+			kind = table_kind(element, record["title"])
+			if kind == None:
+				if heading != None: text.append(element_text(element))
+				continue
+
+			for cells in table_rows(element):
+				rows.append((instruction, kind, len(rows), json.dumps(cells, ensure_ascii=False)))
+				search.append((mnemonic, kind, element.get("section", ""), " | ".join(cells), instruction))
+		if heading != None: sections.append((heading, text))
+
+		self.db.executemany("INSERT INTO rows (instruction, kind, position, cells) VALUES (?, ?, ?, ?)", rows)
+		for i in range(0, len(sections)):
+			heading, text = sections[i]
+			text = "\n".join(t for t in text if len(t) > 0)
+			self.db.execute("INSERT INTO sections (instruction, position, heading, text) VALUES (?, ?, ?, ?)", (instruction, i, heading, text))
+			search.append((mnemonic, SECTION, heading, text, instruction))
+		# an instruction's search rows get consecutive rowids, so that they
+		# can be deleted by rowid: the instruction column is not indexed
+		first = self.db.execute("SELECT coalesce(max(rowid), 0) + 1 FROM search").fetchone()[0]
+		self.db.executemany("INSERT INTO search (rowid, mnemonic, kind, heading, text, instruction) VALUES (?, ?, ?, ?, ?, ?)",
+			[(first + i,) + search[i] for i in range(0, len(search))])
+		self.db.execute("INSERT INTO search_rows (instruction, first, last) VALUES (?, ?, ?)", (instruction, first, first + len(search) - 1))
+
+	def __remove(self, mnemonic):
+		for (instruction,) in self.db.execute("SELECT id FROM instructions WHERE mnemonic = ?", (mnemonic,)).fetchall():
+			for table in ("names", "rows", "sections"):
+				self.db.execute("DELETE FROM %s WHERE instruction = ?" % table, (instruction,))
+			for first, last in self.db.execute("SELECT first, last FROM search_rows WHERE instruction = ?", (instruction,)).fetchall():
+				self.db.execute("DELETE FROM search WHERE rowid BETWEEN ? AND ?", (first, last))
+			self.db.execute("DELETE FROM search_rows WHERE instruction = ?", (instruction,))
+			self.db.execute("DELETE FROM instructions WHERE id = ?", (instruction,))
+
+	# extract.py commits after each document, so an interrupted run keeps
+	# the documents it finished
+	def commit(self):
+		self.db.commit()
+
+	def close(self):
+		self.db.commit()
+		self.db.close()
+
+class IndexReader(object):
+	def __init__(self, path):
+		# as_uri quotes the characters ("?", "#", "%") a path may hold
+		self.db = sqlite3.connect(pathlib.Path(path).absolute().as_uri() + "?mode=ro", uri=True)
+
+	# (id, mnemonic, title, file) of the instructions called name
+	def instructions(self, name):
+		return self.db.execute("SELECT i.id, i.mnemonic, i.title, i.file FROM names n JOIN instructions i ON i.id = n.instruction WHERE n.name = ? ORDER BY i.mnemonic", (name,)).fetchall()
+
+	def rows(self, instruction, kind):
+		return [json.loads(cells) for (cells,) in self.db.execute("SELECT cells FROM rows WHERE instruction = ? AND kind = ? ORDER BY position", (instruction, kind))]
+
+	def sections(self, instruction):
+		return self.db.execute("SELECT heading, text FROM sections WHERE instruction = ? ORDER BY position", (instruction,)).fetchall()
+
+	# (mnemonic, kind, heading, snippet) for each match of an FTS5 query,
+	# best first; kind limits the search to one kind of row
+	def search(self, query, kind=None, limit=20):
+		sql = "SELECT mnemonic, kind, heading, snippet(search, 3, '[', ']', '...', 12) FROM search WHERE search MATCH ?"
+		args = [query]
+		if kind != None:
+			sql += " AND kind = ?"
+			args.append(kind)
+		sql += " ORDER BY rank LIMIT ?"
+		args.append(limit)
+		return self.db.execute(sql, args).fetchall()
+
+	def close(self):
+		self.db.close()
+
+# an FTS5 phrase for text that may contain FTS5 syntax, like "0F 58 /r"
+def phrase(text):
+	return '"%s"' % text.replace('"', '""')
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+# Resident memory accounting for --max-memory. The parser samples it after
+# every page and reports the peak of each instruction section when the next
+# one starts. The budget is what one section adds to the resident memory it
+# started with, not a ceiling for the whole process.
+
+import os
+import sys
+import resource
+
+MEGABYTE = 1024 * 1024
+
+def current_rss():
+	try:
+		with open("/proc/self/statm") as fd:
+			return int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (IOError, ValueError):
+		# No procfs: fall back to the peak RSS so far, which never goes down,
+		# so a section's peak includes everything before it. ru_maxrss is in
+		# bytes on macOS and in kilobytes elsewhere.
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return peak if sys.platform == "darwin" else peak * 1024
+
+class MemoryBudgetExceeded(Exception):
+	pass
+
+class MemoryBudget(object):
+	def __init__(self, limit):
+		self.limit = limit
+		self.peak = 0
+		self.start = current_rss()
+
+	def sample(self):
+		rss = current_rss()
+		self.peak = max(self.peak, rss)
+		return rss
+
+	def check(self, section):
+		rss = self.sample()
+		if rss - self.start > self.limit:
+			raise MemoryBudgetExceeded("%s grew resident memory by %.1f MB (to %.1f MB), over the %.1f MB allowed by --max-memory" % (section, (rss - self.start) / MEGABYTE, rss / MEGABYTE, self.limit / MEGABYTE))
+
+	def end_section(self, section):
+		print(("Peak RSS for %s: %.1f MB" % (section, self.peak / MEGABYTE)))
+		self.peak = self.sample()
+		self.start = self.peak
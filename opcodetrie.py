@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+# Opcode to instruction page lookup, built from the instruction tables of the
+# extracted records and saved as one binary file that OpcodeTrie reads
+# through mmap. Only the standard library is imported here.
+#
+# A key is the encoding space (legacy, VEX, EVEX, XOP) followed by the bytes
+# that select the instruction: mandatory prefixes and escapes, then the
+# opcode. VEX, EVEX and XOP keys spell pp and the opcode map as the legacy
+# bytes they replace (66, F2, F3, 0F, 0F 38, 0F 3A); MAPn and XOP maps are
+# the single byte n. "+rb" style opcodes are stored once per register.
+# ModR/M constraints, REX.W, VEX.L and VEX.W are kept in the entries.
+#
+# File layout, little-endian: header, nodes, children, entries, pages, then a
+# blob of length-prefixed UTF-8 strings.
+#
+#   header   "X86T", version, counts of nodes, children, entries and pages,
+#            size of the string blob
+#   node     child count, entry count, index of first child, of first entry
+#   child    key byte, node index (children of a node are sorted by byte)
+#   entry    encoding, flags, ModR/M, VEX.L, VEX.W, page, form string offset
+#   page     title string offset, file string offset
+
+import re
+import sys
+import mmap
+import struct
+import collections
+import instindex
+
+LEGACY = 0
+VEX = 1
+EVEX = 2
+XOP = 3
+encodings__ = {"VEX": VEX, "EVEX": EVEX, "XOP": XOP}
+
+FLAG_REX_W = 1
+FLAG_PLUS_REG = 2
+FLAG_NO_PREFIX = 4
+
+MODRM_NONE = 0xff
+MODRM_REG = 8
+
+MAGIC = b"X86T"
+VERSION = 1
+header__ = struct.Struct("<4sHHIIIII")
+node__ = struct.Struct("<HHII")
+child__ = struct.Struct("<BI")
+entry__ = struct.Struct("<BBBbbHI")
+page__ = struct.Struct("<II")
+length__ = struct.Struct("<H")
+
+byte_format__ = re.compile(r"^([0-9A-F]{2})(\+(?:R[BWDO]|I)?)?$")
+maps__ = {"0F": [0x0f], "0F38": [0x0f, 0x38], "0F3A": [0x0f, 0x3a]}
+lengths__ = {"128": 0, "L0": 0, "LZ": 0, "256": 1, "L1": 1, "512": 2, "L2": 2, "LIG": -1, "LLIG": -1}
+widths__ = {"W0": 0, "W1": 1, "WIG": -1}
+immediates__ = set(["IB", "IW", "ID", "IO", "CB", "CW", "CD", "CP", "CO", "CT"])
+
+class Opcode(object):
+	__slots__ = ("encoding", "bytes", "flags", "modrm", "length", "width")
+
+	def __init__(self):
+		self.encoding = LEGACY
+		self.bytes = []
+		self.flags = 0
+		self.modrm = MODRM_NONE
+		self.length = -1
+		self.width = -1
+
+	# the keys this opcode is stored under; a "+r" byte near 0xFF only gets
+	# the registers that still fit in a byte
+	def keys(self):
+		key = [self.encoding] + self.bytes
+		if self.flags & FLAG_PLUS_REG:
+			return [key[:-1] + [key[-1] + r] for r in range(0, 8) if key[-1] + r <= 0xff]
+		return [key]
+
+def parse_vex(opcode, token):
+	fields = token.split(".")
+	opcode.encoding = encodings__[fields[0]]
+	for field in fields[1:]:
+		if field in lengths__: opcode.length = lengths__[field]
+		elif field in widths__: opcode.width = widths__[field]
+		elif field in ("66", "F2", "F3"): opcode.bytes.append(int(field, 16))
+		elif field in maps__: opcode.bytes += maps__[field]
+		elif field.startswith("MAP"): opcode.bytes.append(int(field[3:]))
+		elif re.match(r"^M[0-9A-F]{2}$", field): opcode.bytes.append(int(field[1:], 16))
+
+# Reads the opcode at the start of text, as in "66 0F 58 /r", "REX.W + B8+
+# rd io" or "VEX.128.66.0F.WIG 58 /r". Returns the Opcode, or None when text
+# has no opcode bytes, and the rest of text (the instruction, in tables that
+# have an "Opcode/Instruction" column).
+def parse_opcode(text):
+	opcode = Opcode()
+	# "REX.W + 8B" has a lone plus, "B8+ rd" one that belongs to the byte
+	tokens = re.sub(r"\+\s+", "+", re.sub(r"\s+\+\s+", " ", text)).split()
+	used = 0
+	for token in tokens:
+		upper = token.upper()
+		if upper == "REX.W": opcode.flags |= FLAG_REX_W
+		elif upper in ("REX", "REX.R", "NFX"): pass
+		elif upper == "NP": opcode.flags |= FLAG_NO_PREFIX
+		elif upper.split(".")[0] in encodings__ and "." in upper: parse_vex(opcode, upper)
+		elif byte_format__.match(upper):
+			match = byte_format__.match(upper)
+			opcode.bytes.append(int(match.group(1), 16))
+			if match.group(2) != None: opcode.flags |= FLAG_PLUS_REG
+		elif upper in ("+RB", "+RW", "+RD", "+RO", "+I", "RB", "RW", "RD", "RO"):
+			opcode.flags |= FLAG_PLUS_REG
+		elif upper == "/R": opcode.modrm = MODRM_REG
+		elif re.match(r"^/[0-7]$", upper): opcode.modrm = int(upper[1])
+		elif upper in immediates__ or upper.startswith("/IS4") or upper in ("M64", "M128"): pass
+		else: break
+		used += 1
+	if len(opcode.bytes) == 0:
+		return (None, text)
+	return (opcode, " ".join(tokens[used:]))
+
+# (opcode text, instruction text, whether the opcode text also holds the
+# instruction) for each row of an instruction table
+def form_rows(table):
+	rows = instindex.table_rows(table)
+	if len(rows) < 2: return []
+	header = [cell.lower() for cell in rows[0]]
+	opcode_column = None
+	for i in range(0, len(header)):
+		if "opcode" in header[i]:
+			opcode_column = i
+			break
+	if opcode_column == None: return []
+	combined = "instruction" in header[opcode_column]
+	form_column = None
+	for i in range(0, len(header)):
+		if i != opcode_column and header[i].startswith("instruction"):
+			form_column = i
+			break
+
+	result = []
+	for row in rows[1:]:
+		if len(row) != len(header): continue
+		form = "" if form_column == None else row[form_column]
+		result.append((row[opcode_column], form, combined))
+	return result
+
+class OpcodeTrieBuilder(object):
+	def __init__(self):
+		# file -> (title, [(Opcode, form)]); a later record for the same page
+		# replaces the earlier one, like the HTML file
+		self.pages = collections.OrderedDict()
+
+	def add(self, record):
+		forms = []
+		for element in record["elements"]:
+			if instindex.table_kind(element, record["title"]) != instindex.FORM: continue
+			for opcode_text, form, combined in form_rows(element):
+				opcode, rest = parse_opcode(opcode_text)
+				if opcode == None: continue
+				forms.append((opcode, rest.strip() if combined else form))
+		file = "%s.html" % record["instruction"].replace("/", ":")
+		self.pages.pop(file, None)
+		self.pages[file] = (record["title"], forms)
+
+	def save(self, path):
+		strings = bytearray()
+		string_offsets = {}
+		def string(text):
+			if text not in string_offsets:
+				data = text.encode("UTF-8")[:0xffff]
+				string_offsets[text] = len(strings)
+				strings.extend(length__.pack(len(data)))
+				strings.extend(data)
+			return string_offsets[text]
+
+		# nested dicts, one level per key byte; "" holds the entries
+		root = {}
+		pages = []
+		for file, (title, forms) in self.pages.items():
+			page = len(pages)
+			pages.append(page__.pack(string(title), string(file)))
+			for opcode, form in forms:
+				entry = entry__.pack(opcode.encoding, opcode.flags, opcode.modrm, opcode.length, opcode.width, page, string(form))
+				for key in opcode.keys():
+					node = root
+					for byte in key:
+						node = node.setdefault(byte, {})
+					node.setdefault("", []).append(entry)
+
+		# breadth first, so that the children of a node are consecutive
+		nodes = []
+		children = []
+		entries = []
+		queue = collections.deque([root])
+		next_index = 1
+		while len(queue) > 0:
+			node = queue.popleft()
+			keys = sorted(k for k in node if k != "")
+			own = node.get("", [])
+			nodes.append(node__.pack(len(keys), len(own), len(children), len(entries)))
+			entries += own
+			for byte in keys:
+				children.append(child__.pack(byte, next_index))
+				queue.append(node[byte])
+				next_index += 1
+
+		with open(path, "wb") as fd:
+			fd.write(header__.pack(MAGIC, VERSION, 0, len(nodes), len(children), len(entries), len(pages), len(strings)))
+			for chunk in (nodes, children, entries, pages):
+				fd.write(b"".join(chunk))
+			fd.write(strings)
+		print(("Wrote %i opcodes of %i instructions to %s" % (len(entries), len(pages), path)))
+
+Match = collections.namedtuple("Match", ["title", "file", "form", "encoding", "modrm", "rex_w", "length", "width"])
+
+class OpcodeTrie(object):
+	def __init__(self, path):
+		self.__fd = open(path, "rb")
+		self.__map = mmap.mmap(self.__fd.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, _, nodes, children, entries, pages, _ = header__.unpack_from(self.__map, 0)
+		if magic != MAGIC or version != VERSION:
+			raise Exception("%s is not a version %i opcode trie" % (path, VERSION))
+		self.__nodes = header__.size
+		self.__children = self.__nodes + nodes * node__.size
+		self.__entries = self.__children + children * child__.size
+		self.__pages = self.__entries + entries * entry__.size
+		self.__strings = self.__pages + pages * page__.size
+
+	def __string(self, offset):
+		start = self.__strings + offset
+		length = length__.unpack_from(self.__map, start)[0]
+		return self.__map[start + length__.size:start + length__.size + length].decode("UTF-8")
+
+	def __child(self, node, byte):
+		count, _, first, _ = node__.unpack_from(self.__map, self.__nodes + node * node__.size)
+		low = first
+		high = first + count
+		while low < high:
+			middle = (low + high) // 2
+			key, index = child__.unpack_from(self.__map, self.__children + middle * child__.size)
+			if key == byte: return index
+			if key < byte: low = middle + 1
+			else: high = middle
+		return None
+
+	# The instructions whose opcode is the longest prefix of code, a bytes
+	# object that starts at the mandatory prefix (for VEX, EVEX and XOP, at
+	# the pp and map bytes spelled as above). The byte after the opcode, when
+	# given, is taken as ModR/M to check /digit constraints; when it rules
+	# out every entry of the longest prefix, shorter prefixes are tried.
+	def lookup(self, code, encoding=LEGACY):
+		node = self.__child(0, encoding)
+		candidates = []
+		depth = 0
+		while node != None:
+			_, count, _, first = node__.unpack_from(self.__map, self.__nodes + node * node__.size)
+			if count > 0: candidates.append((first, count, depth))
+			if depth == len(code): break
+			node = self.__child(node, code[depth])
+			depth += 1
+
+		while len(candidates) > 0:
+			first, count, depth = candidates.pop()
+			matches = []
+			for i in range(first, first + count):
+				encoding, flags, modrm, length, width, page, form = entry__.unpack_from(self.__map, self.__entries + i * entry__.size)
+				if modrm < 8 and depth < len(code) and (code[depth] >> 3) & 7 != modrm: continue
+				title, file = page__.unpack_from(self.__map, self.__pages + page * page__.size)
+				matches.append(Match(self.__string(title), self.__string(file), self.__string(form), encoding, modrm, flags & FLAG_REX_W != 0, length, width))
+			if len(matches) > 0: return matches
+		return []
+
+	def close(self):
+		self.__map.close()
+		self.__fd.close()
+
+# python opcodetrie.py TRIE [--vex|--evex|--xop] 66 0F 58 C1
+def main(argv):
+	encoding = LEGACY
+	args = []
+	for arg in argv[2:]:
+		if arg.startswith("--"): encoding = encodings__[arg[2:].upper()]
+		else: args.append(int(arg, 16))
+	trie = OpcodeTrie(argv[1])
+	try:
+		matches = trie.lookup(bytes(args), encoding)
+	finally:
+		trie.close()
+	for match in matches:
+		print(("%s\t%s\t%s" % (match.file, match.form, match.title)))
+	return 0 if len(matches) > 0 else 1
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# A pdfminer device that hands x86ManParser (or anything with the same
+# begin_page/process_text_line/process_rect/process_curve/end_page methods)
+# only what it reads. Unlike PDFPageAggregator, it never builds text boxes or
+# the text flow hierarchy, and lines in the page header and footer are thrown
+# away before they reach the parser. Lines are culled whole, by the same test
+# on their bottom edge as x86ManParser.process_text_line: culling characters
+# would split lines that straddle the edge of the band.
+
+from pdfminer.converter import PDFLayoutAnalyzer
+from pdfminer.layout import LTChar, LTRect, LTCurve, LTFigure, LTTextLineHorizontal
+
+class ParserDevice(PDFLayoutAnalyzer):
+	def __init__(self, rsrcmgr, parser, laparams, top=740, bottom=50):
+		PDFLayoutAnalyzer.__init__(self, rsrcmgr, laparams=laparams)
+		self.parser = parser
+		self.top = top
+		self.bottom = bottom
+
+	def end_page(self, page):
+		assert not self._stack, str(len(self._stack))
+		ltpage = self.cur_item
+		self.parser.begin_page(ltpage)
+		self.__emit(ltpage, True)
+		self.parser.end_page(ltpage)
+		self.cur_item = None
+		self.pageno += 1
+
+	def __emit(self, container, group_text):
+		chars = []
+		for obj in container:
+			if isinstance(obj, LTChar):
+				if group_text:
+					chars.append(obj)
+			elif isinstance(obj, LTRect):
+				self.parser.process_rect(obj)
+			elif isinstance(obj, LTCurve):
+				self.parser.process_curve(obj)
+			elif isinstance(obj, LTFigure):
+				self.__emit(obj, self.laparams.all_texts)
+
+		if len(chars) > 0:
+			for line in container.group_objects(self.laparams, chars):
+				if isinstance(line, LTTextLineHorizontal) and line.y0 > self.bottom and line.y0 < self.top:
+					self.parser.process_text_line(line)
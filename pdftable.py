@@ -1,82 +1,122 @@
 #!/usr/bin/env python
 
+import math
+import operator
+import bisect
+
 class Rect:
+	__slots__ = ("x1", "y1", "x2", "y2")
+	
 	def __init__(self, x1, y1, x2, y2):
-		self.__x1 = x1
-		self.__x2 = x2
-		self.__y1 = y1
-		self.__y2 = y2
-	
-	def x1(self): return self.__x1
-	def x2(self): return self.__x2
-	def y1(self): return self.__y1
-	def y2(self): return self.__y2
-	def xmid(self): return (self.__x1 + self.__x2) / 2
-	def ymid(self): return (self.__y1 + self.__y2) / 2
-	
-	def width(self): return abs(self.__x1 - self.__x2)
-	def height(self): return abs(self.__y1 - self.__y2)
-	def area(self): return self.width() * self.height()
+		self.x1 = x1
+		self.x2 = x2
+		self.y1 = y1
+		self.y2 = y2
+	
+	def xmid(self): return (self.x1 + self.x2) / 2
+	def ymid(self): return (self.y1 + self.y2) / 2
+	
+	def width(self): return abs(self.x1 - self.x2)
+	def height(self): return abs(self.y1 - self.y2)
+	def area(self): return abs(self.x1 - self.x2) * abs(self.y1 - self.y2)
 	
 	def points(self):
-		return ((self.__x1, self.__y1), (self.__x1, self.__y2), (self.__x2, self.__y2), (self.__x2, self.__y1))
+		return ((self.x1, self.y1), (self.x1, self.y2), (self.x2, self.y2), (self.x2, self.y1))
 	
 	def union(self, rect):
-		return Rect(min(rect.x1(), self.x1()), min(rect.y1(), self.y1()), max(rect.x2(), self.x2()), max(rect.y2(), self.y2()))
+		return Rect(min(rect.x1, self.x1), min(rect.y1, self.y1), max(rect.x2, self.x2), max(rect.y2, self.y2))
 	
-	def vertical(self): return self.width() < self.height()
-	def horizontal(self): return self.height() < self.width()
+	def vertical(self): return abs(self.x1 - self.x2) < abs(self.y1 - self.y2)
+	def horizontal(self): return abs(self.y1 - self.y2) < abs(self.x1 - self.x2)
 	
 	def __repr__(self):
 		orientation = "V" if self.vertical() else "H"
-		return "Rect{}({:0.2f},{:0.2f},{:0.2f},{:0.2f})".format(orientation, self.x1(), self.y1(), self.x2(), self.y2())
+		return "Rect{}({:0.2f},{:0.2f},{:0.2f},{:0.2f})".format(orientation, self.x1, self.y1, self.x2, self.y2)
 	
 	def intersects(self, that, threshold = 2):
-		if self.x1() - that.x2() - threshold > 0:
+		if self.x1 - that.x2 - threshold > 0:
 			return False
-		if that.x1() - self.x2() - threshold > 0:
+		if that.x1 - self.x2 - threshold > 0:
 			return False
-		if self.y1() - that.y2() - threshold > 0:
+		if self.y1 - that.y2 - threshold > 0:
 			return False
-		if that.y1() - self.y2() - threshold > 0:
+		if that.y1 - self.y2 - threshold > 0:
 			return False
 		return True
 	
 	def contains(self, that):
-		return self.x1() <= that.x1() and self.x2() >= that.x2() and self.y1() <= that.y1() and self.y2() >= that.y2()
+		return self.x1 <= that.x1 and self.x2 >= that.x2 and self.y1 <= that.y1 and self.y2 >= that.y2
 	
 	def debug_html(self, color="black", cls="black"):
 		fmt = '<div class="%s" style="position:absolute;left:%fpx;top:%fpx;width:%fpx;height:%fpx;border:1px %s solid;background-color:%s"></div>'
-		return fmt % (cls, self.x1(), self.y1(), self.width(), self.height(), color, color)
+		return fmt % (cls, self.x1, self.y1, self.width(), self.height(), color, color)
+
+rect_x1 = operator.attrgetter("x1")
+rect_y1 = operator.attrgetter("y1")
 
 def sort_rect_by_position(x, y, dimension):
 	return lambda rect: y(rect) * dimension + x(rect)
 
 def sort_rect(a, b):
-	ydiff = a.y1() - b.y1()
+	ydiff = a.y1 - b.y1
 	if abs(ydiff) > 0.7: return int(ydiff * 100)
 	
-	xdiff = a.x1() - b.x1()
+	xdiff = a.x1 - b.x1
 	if abs(xdiff) > 0.7: return int(xdiff * 100)
 	
-	heightdiff = a.y2() - b.y2()
+	heightdiff = a.y2 - b.y2
 	return int(-heightdiff * 100)
 
-def cluster_rects(lines):
-	table_group = [lines.pop()]
-	just_removed = table_group[:]
-	while len(just_removed) > 0:
-		removed = []
-		for test_against in just_removed:
-			i = 0
-			while i < len(lines):
-				if test_against.intersects(lines[i]):
-					removed.append(lines.pop(i))
-				else:
-					i += 1
-		table_group += removed
-		just_removed = removed
-	return table_group
+class DisjointSets:
+	def __init__(self, count):
+		self.__parent = list(range(0, count))
+	
+	def find(self, i):
+		parent = self.__parent
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+	
+	def union(self, a, b):
+		a = self.find(a)
+		b = self.find(b)
+		if a != b:
+			self.__parent[max(a, b)] = min(a, b)
+		return a != b
+
+# Groups rects that touch each other (directly or through other rects) and
+# returns the groups in the order that repeatedly taking the last rect and
+# everything connected to it would produce. Rects are bucketed in a grid so
+# that only rects sharing a cell are ever compared. Unless given, the cell
+# size is the median rect length plus threshold, so a typical rect covers
+# one or two cells along its length.
+def group_rects(lines, threshold = 2, cell_size = None):
+	if cell_size == None:
+		lengths = sorted(max(rect.width(), rect.height()) for rect in lines)
+		cell_size = max(4 * threshold, lengths[len(lengths) // 2] + threshold if len(lengths) > 0 else 0)
+	sets = DisjointSets(len(lines))
+	grid = {}
+	for i in range(0, len(lines)):
+		rect = lines[i]
+		# intersecting rects have overlapping [x1, x2 + threshold] ranges on both axes
+		x_cells = range(int(math.floor(rect.x1 / cell_size)), int(math.floor((rect.x2 + threshold) / cell_size)) + 1)
+		y_cells = range(int(math.floor(rect.y1 / cell_size)), int(math.floor((rect.y2 + threshold) / cell_size)) + 1)
+		for x in x_cells:
+			for y in y_cells:
+				cell = grid.setdefault((x, y), [])
+				for j in cell:
+					if sets.find(i) != sets.find(j) and rect.intersects(lines[j], threshold):
+						sets.union(i, j)
+				cell.append(i)
+	
+	groups = {}
+	for i in range(len(lines) - 1, -1, -1):
+		groups.setdefault(sets.find(i), []).append(lines[i])
+	result = list(groups.values())
+	for group in result:
+		group.reverse()
+	return result
 
 # this is not particularly statistically sound, but I think that it works
 def count_segments(list, expected_clusters):
@@ -96,6 +136,8 @@ def pretty_much_equal(a, b, threshold = 2):
 	return abs(a - b) < threshold
 
 class Curve:
+	__slots__ = ("__bounds", "points")
+	
 	def __init__(self, points):
 		assert len(points) > 1
 		x = [float("inf"), float("-inf")]
@@ -120,6 +162,76 @@ class List:
 	
 	def bounds(self): return self.rect
 
+# A static R-tree over the bounds of a set of items (anything with a bounds()
+# method), packed bottom-up after sorting by position. It answers which items
+# contain a given rect by only descending into nodes that contain it too.
+class RectIndex:
+	def __init__(self, items, node_size = 8):
+		self.__items = list(items)
+		level = []
+		for i in range(0, len(self.__items)):
+			b = self.__items[i].bounds()
+			level.append((b.x1, b.y1, b.x2, b.y2, i, None))
+		level.sort(key=lambda n: (n[1], n[0]))
+		
+		while len(level) > node_size:
+			parents = []
+			for start in range(0, len(level), node_size):
+				children = level[start:start + node_size]
+				x1 = min(c[0] for c in children)
+				y1 = min(c[1] for c in children)
+				x2 = max(c[2] for c in children)
+				y2 = max(c[3] for c in children)
+				parents.append((x1, y1, x2, y2, -1, children))
+			level = parents
+		self.__roots = level
+	
+	def __len__(self): return len(self.__items)
+	
+	# items containing rect, in the order they were given
+	def containing(self, rect):
+		x1, y1, x2, y2 = rect.x1, rect.y1, rect.x2, rect.y2
+		found = []
+		stack = list(self.__roots)
+		while len(stack) > 0:
+			node = stack.pop()
+			if node[0] <= x1 and node[2] >= x2 and node[1] <= y1 and node[3] >= y2:
+				if node[5] == None:
+					found.append(node[4])
+				else:
+					stack += node[5]
+		found.sort()
+		return [self.__items[i] for i in found]
+	
+	# the smallest item containing rect, or None
+	def innermost(self, rect):
+		best = None
+		for item in self.containing(rect):
+			if best == None or item.bounds().area() < best.bounds().area():
+				best = item
+		return best
+
+# Parent links between items whose bounds nest. Items are ordered by area and
+# each one's parent is the first larger (or equal, later) item containing it.
+class ContainmentTree:
+	def __init__(self, items):
+		self.items = sorted(items, key=lambda item: item.bounds().area())
+		rank = dict((self.items[i], i) for i in range(0, len(self.items)))
+		index = RectIndex(self.items)
+		self.__parent = {}
+		self.__children = dict((item, []) for item in self.items)
+		for i in range(0, len(self.items)):
+			item = self.items[i]
+			for container in index.containing(item.bounds()):
+				if rank[container] > i:
+					self.__parent[item] = container
+					self.__children[container].append(item)
+					break
+	
+	def parent(self, item): return self.__parent.get(item)
+	def children(self, item): return self.__children[item]
+	def roots(self): return [item for item in self.items if item not in self.__parent]
+
 class TableBase:
 	def get_at(self, x, y): raise Exception("Not implemented")
 	def get_everything(self): raise Exception("Not implemented")
@@ -128,7 +240,27 @@ class TableBase:
 	def columns(self): raise Exception("Not implemented")
 	def bounds(self): raise Exception("Not implemented")
 	def cell_size(self, x, y): raise Exception("Not implemented")
+	def cell_span(self, x, y): raise Exception("Not implemented")
 	def data_index(self, x, y): raise Exception("Not implemented")
+	
+	# (column, row, colspan, rowspan, items) for each cell, at its top left
+	def data_cells(self):
+		seen = set()
+		cells = []
+		for row in range(0, self.rows()):
+			for col in range(0, self.columns()):
+				index = self.data_index(col, row)
+				if index in seen: continue
+				seen.add(index)
+				colspan, rowspan = self.cell_span(col, row)
+				cells.append((col, row, colspan, rowspan, self.get_at(col, row)))
+		return cells
+	
+	# key(item) gives the (x, y) pixel where each item goes
+	def add_at_pixels(self, items, key):
+		for item in items:
+			x, y = key(item)
+			self.get_at_pixel(x, y).append(item)
 
 class ImplicitTable(TableBase):
 	def __init__(self, bounds, table_data):
@@ -162,6 +294,8 @@ class ImplicitTable(TableBase):
 		assert y >= 0 and y < self.rows()
 		return (1, 1)
 	
+	def cell_span(self, x, y): return self.cell_size(x, y)
+	
 	def data_index(self, x, y): return y * self.columns() + x
 	
 	def debug_html(self):
@@ -177,8 +311,18 @@ class ImplicitTable(TableBase):
 		result += '</table>'
 		return result
 
+# The grid is found from the line coordinates sorted by position. The layout
+# has one number per grid square; squares that belong to the same cell share
+# a number.
 class Table(TableBase):
 	def __init__(self, group):
+		layout = self.__layout(group)
+		# lines that all sit on one row or column leave no cells
+		if len(layout) == 0 or len(layout[0]) == 0:
+			raise Exception("Table has no cells")
+		self.__init_data_storage(layout)
+	
+	def __layout(self, group):
 		ver = []
 		hor = []
 		for line in group:
@@ -189,55 +333,50 @@ class Table(TableBase):
 		
 		self.__columns = self.__identify_dimension(ver, Rect.xmid)
 		self.__rows = self.__identify_dimension(hor, Rect.ymid)
-		self.__init_data_layout()
+		col_count = len(self.__columns) - 1
+		layout = [list(range(row * col_count, (row + 1) * col_count)) for row in range(0, len(self.__rows) - 1)]
 		
 		if len(self.__columns) > 2:
 			missingC = self.__identify_missing_col_lines(ver)
-			missingC.sort(key=sort_rect_by_position(Rect.y1, Rect.xmid, self.__columns[-1]))
+			missingC.sort(key=sort_rect_by_position(rect_y1, Rect.xmid, self.__columns[-1]))
 			for missing in missingC:
 				rightColumn = self.__data_col_index(missing.xmid())
-				assert rightColumn != 0 and rightColumn != len(self.__columns)
-				leftColumn = rightColumn - 1
-				beginIndex = self.__data_row_index(missing.y1())
-				endIndex = self.__data_row_index(missing.y2())
+				assert rightColumn != 0
+				beginIndex = self.__data_row_index(missing.y1)
+				endIndex = self.__data_row_index(missing.y2)
 				for i in range(beginIndex, endIndex):
-					self.__data_layout[i][rightColumn] = self.__data_layout[i][leftColumn]
+					layout[i][rightColumn] = layout[i][rightColumn - 1]
 		
 		if len(self.__rows) > 2:
 			missingR = self.__identify_missing_row_lines(hor)
-			missingR.sort(key=sort_rect_by_position(Rect.x1, Rect.ymid, self.__rows[-1]))
+			missingR.sort(key=sort_rect_by_position(rect_x1, Rect.ymid, self.__rows[-1]))
 			for missing in missingR:
 				topRow = self.__data_row_index(missing.ymid())
-				assert topRow != 0 and topRow != len(self.__rows) - 1
-				bottomRow = topRow - 1
-				beginIndex = self.__data_col_index(missing.x1())
-				endIndex = self.__data_col_index(missing.x2())
-			
+				assert topRow != 0
+				begin = self.__data_col_index(missing.x1)
+				end = self.__data_col_index(missing.x2)
 				# Do not merge into non-rectangular cells.
-				if beginIndex > 0:
-					prev = beginIndex - 1
-					if self.__data_layout[topRow][prev] == self.__data_layout[topRow][beginIndex]:
-						continue
-			
-				if endIndex < len(self.__rows) - 1:
-					prev = endIndex - 1
-					if self.__data_layout[topRow][prev] == self.__data_layout[topRow][endIndex]:
-						continue
-			
-				for i in range(beginIndex, endIndex):
-					self.__data_layout[bottomRow][i] = self.__data_layout[topRow][i]
-		
-		self.__init_data_storage()
+				if begin > 0 and layout[topRow][begin - 1] == layout[topRow][begin]:
+					continue
+				if end < col_count and layout[topRow][end - 1] == layout[topRow][end]:
+					continue
+				layout[topRow - 1][begin:end] = layout[topRow][begin:end]
+		return layout
 	
 	def get_at_pixel(self, x, y):
 		row_index = self.__data_row_index(y)
 		col_index = self.__data_col_index(x)
 		return self.get_at(col_index, row_index)
 	
+	def add_at_pixels(self, items, key):
+		points = [key(item) for item in items]
+		cols = self.__sweep_indices(self.__columns, [p[0] for p in points])
+		rows = self.__sweep_indices(self.__rows, [p[1] for p in points])
+		for i in range(0, len(items)):
+			self.__data_storage[self.__data_layout[rows[i]][cols[i]]].append(items[i])
+	
 	def get_at(self, x, y):
-		row = self.__data_layout[y]
-		data_index = row[x]
-		return self.__data_storage[data_index]
+		return self.__data_storage[self.__data_layout[y][x]]
 	
 	def get_everything(self):
 		result = []
@@ -260,6 +399,10 @@ class Table(TableBase):
 		col_index = self.__data_col_index(x)
 		return self.__cell_size(col_index, row_index)
 	
+	# cell_size takes pixels; this takes column and row indices
+	def cell_span(self, x, y):
+		return self.__cell_size(x, y)
+	
 	def data_index(self, x, y):
 		return self.__data_layout[y][x]
 	
@@ -284,18 +427,25 @@ class Table(TableBase):
 		result += "</table>"
 		return result
 	
+	# sorts lines by key and returns the distinct key values
 	def __identify_dimension(self, lines, key):
-		lines.sort(key=key)
+		values = [key(line) for line in lines]
+		order = sorted(range(0, len(lines)), key=values.__getitem__)
+		lines[:] = [lines[i] for i in order]
 		dim = []
-		for line in lines:
-			value = key(line)
+		for i in order:
+			value = values[i]
 			if len(dim) == 0 or value - dim[-1] > 1:
 				dim.append(value)
 		return dim
 	
+	# Lines are scanned column by column, top to bottom. A gap between two
+	# lines of the same column, or between the last line of a column and the
+	# bottom of the table, is a missing line.
 	def __identify_missing_col_lines(self, vertical):
-		sort_key = sort_rect_by_position(Rect.y1, Rect.xmid, self.__rows[0] - self.__rows[-1])
-		vertical.sort(key=sort_key)
+		dimension = self.__rows[0] - self.__rows[-1]
+		lines = [(line.xmid(), line.y1, line.y2) for line in vertical]
+		lines.sort(key=lambda line: line[0] * dimension + line[1])
 		missing_lines = []
 		def add_missing_line(x, y1, y2):
 			missing_lines.append(Rect(x, y1, x, y2))
@@ -304,21 +454,23 @@ class Table(TableBase):
 		botY = self.__rows[-1] - 0.001
 		lastX = self.__columns[0]
 		lastY = botY
-		for line in vertical[1:]:
-			if not pretty_much_equal(line.xmid(), lastX):
-				if not pretty_much_equal(lastY, botY):
+		for x, y1, y2 in lines[1:]:
+			if abs(x - lastX) >= 2:
+				if abs(lastY - botY) >= 2:
 					add_missing_line(lastX, lastY, botY)
 				lastY = topY
 			
-			if not pretty_much_equal(line.y1(), lastY):
-				add_missing_line(line.xmid(), lastY, line.y1())
-			lastY = line.y2()
-			lastX = line.xmid()
+			if abs(y1 - lastY) >= 2:
+				add_missing_line(x, lastY, y1)
+			lastY = y2
+			lastX = x
 		return missing_lines
 	
+	# Same as __identify_missing_col_lines, row by row from left to right.
 	def __identify_missing_row_lines(self, horizontal):
-		sort_key = sort_rect_by_position(Rect.x1, Rect.ymid, self.__columns[-1] - self.__columns[0])
-		horizontal.sort(key=sort_key)
+		dimension = self.__columns[-1] - self.__columns[0]
+		lines = [(line.ymid(), line.x1, line.x2) for line in horizontal]
+		lines.sort(key=lambda line: line[0] * dimension + line[1])
 		missing_lines = []
 		def add_missing_line(y, x1, x2):
 			missing_lines.append(Rect(x1, y, x2, y))
@@ -327,44 +479,32 @@ class Table(TableBase):
 		botX = self.__columns[-1] - 0.001
 		lastX = botX
 		lastY = self.__rows[0]
-		for line in horizontal[1:]:
-			if not pretty_much_equal(line.ymid(), lastY):
-				if not pretty_much_equal(lastX, botX):
+		for y, x1, x2 in lines[1:]:
+			if abs(y - lastY) >= 2:
+				if abs(lastX - botX) >= 2:
 					add_missing_line(lastY, lastX, botX)
 				lastX = topX
 			
-			if not pretty_much_equal(line.x1(), lastX):
-				add_missing_line(line.ymid(), lastX, line.x1())
-			lastY = line.ymid()
-			lastX = line.x2()
+			if abs(x1 - lastX) >= 2:
+				add_missing_line(y, lastX, x1)
+			lastY = y
+			lastX = x2
 		return missing_lines
 	
-	def __init_data_layout(self):
-		self.__data_layout = []
-		i = 0
-		row_count = len(self.__rows) - 1
-		col_count = len(self.__columns) - 1
-		for _ in range(0, row_count):
-			row = []
-			for _ in range(0, col_count):
-				row.append(i)
-				i += 1
-			self.__data_layout.append(row)
-	
-	def __init_data_storage(self):
+	def __init_data_storage(self, layout):
+		# Number cells in reading order: the number goes up whenever a grid
+		# square holds a higher value than any square before it.
 		i = 0
 		last_index = 0
-		for row_index in range(0, len(self.__data_layout)):
-			row = self.__data_layout[row_index]
+		for row in layout:
 			for cell_index in range(0, len(row)):
 				if row[cell_index] > last_index:
 					i += 1
 					last_index = row[cell_index]
 				row[cell_index] = i
+		self.__data_layout = layout
 		
-		self.__data_storage = []
-		for i in range(0, self.__data_layout[-1][-1] + 1):
-			self.__data_storage.append([])
+		self.__data_storage = [[] for i in range(0, i + 1)]
 	
 	def __data_row_index(self, y):
 		return self.__dim_index(self.__rows, y)
@@ -373,34 +513,46 @@ class Table(TableBase):
 		return self.__dim_index(self.__columns, x)
 	
 	def __dim_index(self, array, value):
-		for i in range(1, len(array)):
-			ref_value = array[i]
-			if ref_value > value:
-				return i - 1
-		
-		raise Exception("improbable ({:g} between {:g} and {:g})".format(value, array[0], array[-1]))
+		i = bisect.bisect_right(array, value, 1)
+		if i == len(array):
+			raise Exception("improbable ({:g} between {:g} and {:g})".format(value, array[0], array[-1]))
+		return i - 1
+	
+	# __dim_index for many values at once, with one pass over the boundaries
+	def __sweep_indices(self, array, values):
+		result = [0] * len(values)
+		i = 1
+		for index in sorted(range(0, len(values)), key=values.__getitem__):
+			value = values[index]
+			while i < len(array) and array[i] <= value:
+				i += 1
+			if i == len(array):
+				raise Exception("improbable ({:g} between {:g} and {:g})".format(value, array[0], array[-1]))
+			result[index] = i - 1
+		return result
 	
 	def __cell_size(self, column, row):
-		value = self.__data_layout[row][column]
+		layout = self.__data_layout
+		value = layout[row][column]
 		width = 0
 		x = column
-		while x >= 0 and self.__data_layout[row][x] == value:
+		while x >= 0 and layout[row][x] == value:
 			width += 1
 			x -= 1
 		
 		x = column + 1
-		while x < len(self.__data_layout[row]) and self.__data_layout[row][x] == value:
+		while x < len(layout[row]) and layout[row][x] == value:
 			width += 1
 			x += 1
 		
 		height = 0
 		y = row
-		while y >= 0 and self.__data_layout[y][column] == value:
+		while y >= 0 and layout[y][column] == value:
 			height += 1
 			y -= 1
 		
 		y = row + 1
-		while y < len(self.__data_layout) and self.__data_layout[y][column] == value:
+		while y < len(layout) and layout[y][column] == value:
 			height += 1
 			y += 1
 		
@@ -472,15 +624,12 @@ def main():
 
 	lines = []
 	figures = []
-	tables = []
-	for i in range(0, len(rects)):
-		rect = Rect(*rects[i])
+	for r in rects:
+		rect = Rect(*r)
 		(lines if (rect.width() < 9 or rect.height() < 9) else figures).append(rect)
 
 	# group lines into tables
-	while len(lines) > 0:
-		table = cluster_rects(lines)
-		tables.append(table)
+	tables = group_rects(lines)
 
 	for table in tables:
 		t = Table(table)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# Finds where each instruction starts without laying pages out. The PDF
+# outline is used when it has instruction entries; otherwise every page's
+# text is interpreted, but only the font and position of its characters are
+# kept, to find the same NeoSansIntelMedium >= 12pt headings that
+# x86ManParser starts a new instruction on.
+
+import re
+from pdfminer.pdfdevice import PDFTextDevice
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
+from pdfminer.psparser import PSLiteral
+from pdfminer.pdfdocument import PDFNoOutlines
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.utils import apply_matrix_pt
+
+# An instruction entry of the outline: mnemonics separated by slashes, commas
+# or spaces, as in "MOVS/MOVSB—Move Data from String to String",
+# "INT n/INTO/INT3/INT1—..." or "MOVDQA,VMOVDQA32/64—...", then an em or en
+# dash. Chapter entries such as "Instruction Set Reference, A-L" have no such
+# dash and do not match.
+title_format__ = re.compile(r"^\s*[A-Z][A-Za-z0-9 ,/]*?\s*[—–]\s*\S")
+# the mnemonic of a heading; page headings may use a plain hyphen
+mnemonic_format__ = re.compile(r"^\s*(\S.*?)\s*[-—–]\s*\S")
+
+class Section(object):
+	__slots__ = ("title", "first", "last")
+
+	def __init__(self, title, first, last):
+		self.title = title
+		self.first = first   # page index of the heading
+		self.last = last     # one past the last page
+
+	def mnemonic(self):
+		match = mnemonic_format__.match(self.title)
+		return match.group(1) if match else self.title.strip()
+
+	# ADDPD, or MOVS and MOVSB for "MOVS/MOVSB"
+	def names(self):
+		mnemonic = self.mnemonic().upper()
+		return set([mnemonic] + [n.strip() for n in re.split(r"[/,]", mnemonic) if len(n.strip()) > 0])
+
+	def pages(self): return range(self.first, self.last)
+
+	def __repr__(self): return "<Section %r pages %i-%i>" % (self.title, self.first, self.last)
+
+def sections_from_starts(starts, page_count):
+	starts.sort(key=lambda start: start[0])
+	sections = []
+	for i in range(0, len(starts)):
+		first, title = starts[i]
+		last = starts[i + 1][0] if i + 1 < len(starts) else page_count
+		if last > first:
+			sections.append(Section(title, first, last))
+	return sections
+
+def outline_sections(document, page_count):
+	page_index = dict((page.pageid, i) for i, page in enumerate(PDFPage.create_pages(document)))
+	starts = []
+	try:
+		for level, title, dest, action, se in document.get_outlines():
+			if not title_format__.match(title): continue
+			page = destination_page(document, dest, action)
+			if page in page_index:
+				starts.append((page_index[page], title))
+	except PDFNoOutlines:
+		return []
+	return sections_from_starts(starts, page_count)
+
+def destination_page(document, dest, action):
+	if dest == None and action != None:
+		action = resolve1(action)
+		if isinstance(action, dict) and action.get("D") != None:
+			dest = action["D"]
+	dest = resolve1(dest)
+	if isinstance(dest, PSLiteral): dest = dest.name
+	if isinstance(dest, (str, bytes)):
+		dest = resolve1(document.get_dest(dest))
+	if isinstance(dest, dict): dest = resolve1(dest.get("D"))
+	if isinstance(dest, list) and len(dest) > 0:
+		return getattr(dest[0], "objid", None)
+	return None
+
+# Keeps (fontname, size, x0, y0, y1, text) for every character of a page.
+class FontDevice(PDFTextDevice):
+	def __init__(self, rsrcmgr):
+		PDFTextDevice.__init__(self, rsrcmgr)
+		self.chars = []
+
+	def begin_page(self, page, ctm):
+		PDFTextDevice.begin_page(self, page, ctm)
+		self.chars = []
+
+	def render_char(self, matrix, font, fontsize, scaling, rise, cid, ncs, graphicstate):
+		try:
+			text = font.to_unichr(cid)
+		except PDFUnicodeNotDefined:
+			text = ""
+		adv = font.char_width(cid) * fontsize * scaling
+		descent = font.get_descent() * fontsize
+		(x0, y0) = apply_matrix_pt(matrix, (0, descent + rise))
+		(x1, y1) = apply_matrix_pt(matrix, (adv, descent + rise + fontsize))
+		self.chars.append((font.fontname, matrix[0], min(x0, x1), min(y0, y1), max(y0, y1), text))
+		return adv
+
+# the text of a page's first line, if that line is an instruction heading
+def page_heading(chars, top=740, bottom=50):
+	body = [c for c in chars if c[3] > bottom and c[3] < top]
+	if len(body) == 0: return None
+	highest = max(c[4] for c in body)
+	line = [c for c in body if c[4] > highest - 2]
+	line.sort(key=lambda c: c[2])
+	fontname, size = line[0][0], line[0][1]
+	if fontname[7:] != "NeoSansIntelMedium" or size < 12: return None
+	return "".join(c[5] for c in line if c[1] == size)
+
+def font_sections(fd, page_count):
+	resMan = PDFResourceManager(caching=True)
+	device = FontDevice(resMan)
+	interpreter = PDFPageInterpreter(resMan, device)
+	starts = []
+	index = 0
+	for page in PDFPage.get_pages(fd, set(), caching=True, check_extractable=True):
+		interpreter.process_page(page)
+		title = page_heading(device.chars)
+		if title != None:
+			starts.append((index, title))
+		index += 1
+	return sections_from_starts(starts, page_count)
+
+# purpose says what the sections are needed for, in the message printed when
+# the outline has none and every page has to be read
+def scan_sections(document, fd, page_count, text_pass=True, purpose=None):
+	sections = outline_sections(document, page_count)
+	if len(sections) == 0 and text_pass:
+		print(("No instruction outline, scanning page fonts%s" % ("" if purpose == None else " to " + purpose)))
+		sections = font_sections(fd, page_count)
+	return sections
+
+def select_sections(sections, mnemonics):
+	wanted = set(m.strip().upper() for m in mnemonics if len(m.strip()) > 0)
+	return [section for section in sections if len(section.names() & wanted) > 0]
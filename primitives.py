@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Picklable copies of the only parts of a pdfminer layout that x86ManParser
+# looks at: horizontal text lines (with their characters), rectangles and
+# curves. Pages captured in worker processes are sent back as these.
+
+from pdfminer.layout import LTChar
+
+class Char(object):
+	__slots__ = ("text", "fontname", "matrix", "x0", "y0", "x1", "y1")
+
+	def __init__(self, text, fontname, matrix, bbox):
+		self.text = text
+		self.fontname = fontname
+		self.matrix = matrix
+		self.x0, self.y0, self.x1, self.y1 = bbox
+
+	def get_text(self): return self.text
+
+# whitespace inserted by the layout analysis; like LTAnno, it has no font
+class Anno(object):
+	__slots__ = ("text",)
+
+	def __init__(self, text):
+		self.text = text
+
+	def get_text(self): return self.text
+
+class TextLine(object):
+	__slots__ = ("bbox", "chars")
+
+	def __init__(self, bbox, chars):
+		self.bbox = bbox
+		self.chars = chars
+
+	def __iter__(self): return iter(self.chars)
+
+class Shape(object):
+	__slots__ = ("bbox", "pts")
+
+	def __init__(self, bbox, pts=None):
+		self.bbox = bbox
+		self.pts = pts
+
+class Page(object):
+	def __init__(self, bbox):
+		self.bbox = bbox
+		self.text_lines = []
+		self.rects = []
+		self.curves = []
+
+	def feed(self, parser):
+		parser.begin_page(self)
+		for line in self.text_lines: parser.process_text_line(line)
+		for rect in self.rects: parser.process_rect(rect)
+		for curve in self.curves: parser.process_curve(curve)
+		parser.end_page(self)
+
+def capture_char(c):
+	if isinstance(c, LTChar):
+		return Char(c.get_text(), c.fontname, tuple(c.matrix), (c.x0, c.y0, c.x1, c.y1))
+	return Anno(c.get_text())
+
+# stands in for x86ManParser behind a ParserDevice and keeps copies of the pages
+class PageRecorder(object):
+	def __init__(self):
+		self.pages = []
+		self.page = None
+
+	def begin_page(self, page):
+		self.page = Page(tuple(page.bbox))
+
+	def process_text_line(self, line):
+		self.page.text_lines.append(TextLine(tuple(line.bbox), [capture_char(c) for c in line]))
+
+	def process_rect(self, rect):
+		self.page.rects.append(Shape(tuple(rect.bbox)))
+
+	def process_curve(self, curve):
+		self.page.curves.append(Shape(tuple(curve.bbox), list(curve.pts)))
+
+	def end_page(self, page):
+		self.pages.append(self.page)
+		self.page = None
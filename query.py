@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# Looks instructions up in the index that extract.py --index builds:
+#
+#   python query.py ADDPD              instruction forms and operand encodings
+#   python query.py --opcode "0F 58"   instructions with that opcode sequence
+#   python query.py --search "packed double"
+#
+# Only the standard library and instindex are imported.
+
+import os
+import sys
+import argparse
+import instindex
+
+def print_rows(rows, indent="  "):
+	for cells in rows:
+		print(indent + " | ".join(cells))
+
+def print_instruction(reader, instruction, mnemonic, title, file, sections):
+	print(("%s (%s)" % (title, file)))
+	print_rows(reader.rows(instruction, instindex.FORM))
+	encodings = reader.rows(instruction, instindex.ENCODING)
+	if len(encodings) > 0:
+		print("  Operand encoding:")
+		print_rows(encodings, "    ")
+	if sections:
+		for heading, text in reader.sections(instruction):
+			print(("  %s" % heading))
+			for line in text.split("\n"):
+				print(("    %s" % line))
+
+def main(argv):
+	argParser = argparse.ArgumentParser(description="Query the instruction index.")
+	argParser.add_argument("mnemonics", nargs="*", metavar="mnemonic")
+	argParser.add_argument("--db", default="html/instructions.sqlite", help="index written by extract.py --index")
+	argParser.add_argument("--opcode", help="find instruction forms whose row contains these opcode bytes")
+	argParser.add_argument("--search", metavar="QUERY", help="FTS5 query over titles, instruction forms, encodings and section text")
+	argParser.add_argument("--sections", action="store_true", help="also print each instruction's section text")
+	argParser.add_argument("--limit", type=int, default=20)
+	args = argParser.parse_args(argv[1:])
+	if not os.path.exists(args.db):
+		argParser.error("no index at %s, build one with extract.py --index %s" % (args.db, args.db))
+
+	reader = instindex.IndexReader(args.db)
+	found = 0
+	try:
+		for name in args.mnemonics:
+			for instruction, mnemonic, title, file in reader.instructions(name):
+				print_instruction(reader, instruction, mnemonic, title, file, args.sections)
+				found += 1
+		matches = []
+		if args.opcode:
+			matches += reader.search(instindex.phrase(args.opcode), instindex.FORM, args.limit)
+		if args.search:
+			matches += reader.search(args.search, None, args.limit)
+		for mnemonic, kind, heading, snippet in matches:
+			print(("%-12s %-8s %s" % (mnemonic, kind, snippet.replace("\n", " / "))))
+			found += 1
+	finally:
+		reader.close()
+	if found == 0:
+		print("Nothing found")
+		return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+# Where x86ManParser puts the pages it renders. A sink has write(name, text),
+# location(name) for messages, directory() (the directory that render pool
+# processes may write to themselves, or None), failed(wait) (the pages whose
+# write failed after write returned) and close().
+
+import os
+import queue
+import threading
+
+# one file per page, the original layout of the output
+class DirectorySink(object):
+	def __init__(self, path):
+		self.path = path
+
+	def write(self, name, text):
+		with open(os.path.join(self.path, name), "w", encoding="UTF-8", newline="\n") as fd:
+			fd.write(text)
+
+	def location(self, name): return "%s/%s" % (self.path, name)
+	def directory(self): return self.path
+	def failed(self, wait=False): return []
+	def close(self): pass
+
+# Pages are appended to one pack file and their offsets to an index next to
+# it, one "offset<TAB>length<TAB>name" line each. Nothing is ever rewritten:
+# when a name is written twice, the last index line wins.
+class ArchiveSink(object):
+	def __init__(self, path):
+		self.path = path
+		self.__pack = open(path, "ab")
+		self.__index = open(path + ".index", "a", encoding="UTF-8", newline="\n")
+		self.__offset = self.__pack.seek(0, os.SEEK_END)
+
+	def write(self, name, text):
+		data = text.encode("UTF-8")
+		self.__pack.write(data)
+		self.__index.write("%i\t%i\t%s\n" % (self.__offset, len(data), name))
+		self.__offset += len(data)
+
+	def location(self, name): return "%s:%s" % (self.path, name)
+	def directory(self): return None
+	def failed(self, wait=False): return []
+
+	def close(self):
+		self.__pack.close()
+		self.__index.close()
+
+class ArchiveReader(object):
+	def __init__(self, path):
+		self.entries = {}
+		with open(path + ".index", encoding="UTF-8") as fd:
+			for line in fd:
+				offset, length, name = line.rstrip("\n").split("\t", 2)
+				self.entries[name] = (int(offset), int(length))
+		self.__pack = open(path, "rb")
+
+	def names(self): return sorted(self.entries)
+
+	def read(self, name):
+		offset, length = self.entries[name]
+		self.__pack.seek(offset)
+		return self.__pack.read(length).decode("UTF-8")
+
+	def close(self):
+		self.__pack.close()
+
+# keeps the pages of a render pool process for the main process to write
+class MemorySink(object):
+	def __init__(self):
+		self.files = []
+
+	def write(self, name, text): self.files.append((name, text))
+	def location(self, name): return name
+	def directory(self): return None
+	def failed(self, wait=False): return []
+	def close(self): pass
+
+# Hands writes to a thread through a queue of at most size pages, so the
+# parser only waits when the disk falls that far behind. A page the thread
+# cannot write is kept with its error for failed() instead of stopping the
+# writes that follow it.
+class ThreadedSink(object):
+	def __init__(self, sink, size=16):
+		self.sink = sink
+		self.__queue = queue.Queue(size)
+		self.__failed = []
+		self.__lock = threading.Lock()
+		self.__thread = threading.Thread(target=self.__run, name="page writer", daemon=True)
+		self.__thread.start()
+
+	def __run(self):
+		while True:
+			item = self.__queue.get()
+			try:
+				if item == None: break
+				try:
+					self.sink.write(*item)
+				except Exception as e:
+					with self.__lock: self.__failed.append((item[0], e))
+			finally:
+				self.__queue.task_done()
+
+	def write(self, name, text):
+		self.__queue.put((name, text))
+
+	def location(self, name): return self.sink.location(name)
+	def directory(self): return self.sink.directory()
+
+	# (name, error) of the pages that failed since the last call; with wait,
+	# once every page queued so far has been written
+	def failed(self, wait=False):
+		if wait: self.__queue.join()
+		with self.__lock:
+			failed = self.__failed
+			self.__failed = []
+		return failed
+
+	def close(self):
+		self.__queue.put(None)
+		self.__thread.join()
+		self.sink.close()
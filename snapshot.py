@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+# On-disk cache of extracted page primitives. Every column is a flat typed
+# array and a JSON header says where each one starts, so a snapshot can be
+# mapped into memory and its pages rebuilt one at a time.
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+import primitives
+
+# also part of the cache key: raise it when the recorded pages change, as
+# when ParserDevice started culling whole lines (3)
+SNAPSHOT_VERSION = 3
+MAGIC = b"x86snap\0"
+
+columns__ = [
+	("page_bbox", "d"),     # 4 per page
+	("page_lines", "q"),    # index of the first line of each page, plus an end marker
+	("page_rects", "q"),
+	("page_curves", "q"),
+	("line_bbox", "d"),     # 4 per line
+	("line_chars", "q"),    # index of the first char of each line, plus an end marker
+	("char_text", "i"),     # glyph table index
+	("char_font", "i"),     # font table index, -1 for whitespace added by the layout analysis
+	("char_matrix", "d"),   # 6 per char
+	("char_bbox", "d"),     # 4 per char
+	("rect_bbox", "d"),     # 4 per rect
+	("curve_bbox", "d"),    # 4 per curve
+	("curve_points", "q"),  # index of the first point of each curve, plus an end marker
+	("points", "d"),        # 2 per point
+]
+
+def snapshot_key(path, laParams):
+	digest = hashlib.sha256()
+	with open(path, "rb") as fd:
+		for block in iter(lambda: fd.read(1 << 20), b""):
+			digest.update(block)
+	params = json.dumps(sorted(vars(laParams).items()), default=repr)
+	digest.update(("\0%i\0%s" % (SNAPSHOT_VERSION, params)).encode("UTF-8"))
+	return digest.hexdigest()
+
+def snapshot_path(cacheDir, key):
+	return os.path.join(cacheDir, "%s.snap" % key)
+
+class Interner(object):
+	def __init__(self):
+		self.items = []
+		self.index = {}
+
+	def __call__(self, value):
+		i = self.index.get(value)
+		if i == None:
+			i = len(self.items)
+			self.index[value] = i
+			self.items.append(value)
+		return i
+
+class SnapshotWriter(object):
+	def __init__(self):
+		self.columns = dict((name, array(code)) for name, code in columns__)
+		for name in ("page_lines", "page_rects", "page_curves", "line_chars", "curve_points"):
+			self.columns[name].append(0)
+		self.fonts = Interner()
+		self.glyphs = Interner()
+
+	def add_page(self, page):
+		c = self.columns
+		c["page_bbox"].extend(page.bbox)
+		for line in page.text_lines:
+			c["line_bbox"].extend(line.bbox)
+			for char in line:
+				c["char_text"].append(self.glyphs(char.get_text()))
+				if isinstance(char, primitives.Char):
+					c["char_font"].append(self.fonts(char.fontname))
+					c["char_matrix"].extend(char.matrix)
+					c["char_bbox"].extend((char.x0, char.y0, char.x1, char.y1))
+				else:
+					c["char_font"].append(-1)
+					c["char_matrix"].extend((0,) * 6)
+					c["char_bbox"].extend((0,) * 4)
+			c["line_chars"].append(len(c["char_text"]))
+		for rect in page.rects:
+			c["rect_bbox"].extend(rect.bbox)
+		for curve in page.curves:
+			c["curve_bbox"].extend(curve.bbox)
+			for p in curve.pts:
+				c["points"].extend(p)
+			c["curve_points"].append(len(c["points"]) // 2)
+		c["page_lines"].append(len(c["line_chars"]) - 1)
+		c["page_rects"].append(len(c["rect_bbox"]) // 4)
+		c["page_curves"].append(len(c["curve_points"]) - 1)
+
+	def save(self, path):
+		header = {"version": SNAPSHOT_VERSION, "fonts": self.fonts.items, "glyphs": self.glyphs.items, "columns": []}
+		offset = 0
+		for name, code in columns__:
+			column = self.columns[name]
+			header["columns"].append([name, code, offset, len(column)])
+			offset += (len(column) * column.itemsize + 7) & ~7
+		header = json.dumps(header).encode("UTF-8")
+		start = (len(MAGIC) + 8 + len(header) + 7) & ~7
+
+		temp = path + ".tmp"
+		with open(temp, "wb") as fd:
+			fd.write(MAGIC)
+			fd.write(struct.pack("<Q", len(header)))
+			fd.write(header)
+			for name, code in columns__:
+				fd.write(b"\0" * ((-fd.tell()) & 7))
+				self.columns[name].tofile(fd)
+			fd.write(b"\0" * (start + offset - fd.tell()))
+		os.replace(temp, path)
+
+class Snapshot(object):
+	def __init__(self, path):
+		self.__fd = open(path, "rb")
+		self.__map = mmap.mmap(self.__fd.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.__map[0:len(MAGIC)] != MAGIC:
+			raise Exception("%s is not a page snapshot" % path)
+		length = struct.unpack_from("<Q", self.__map, len(MAGIC))[0]
+		header_start = len(MAGIC) + 8
+		header = json.loads(self.__map[header_start:header_start + length].decode("UTF-8"))
+		if header["version"] != SNAPSHOT_VERSION:
+			raise Exception("%s has snapshot version %i, expected %i" % (path, header["version"], SNAPSHOT_VERSION))
+
+		self.fonts = header["fonts"]
+		self.glyphs = header["glyphs"]
+		start = (header_start + length + 7) & ~7
+		self.__view = memoryview(self.__map)
+		self.__columns = {}
+		for name, code, offset, count in header["columns"]:
+			size = array(code).itemsize
+			self.__columns[name] = self.__view[start + offset:start + offset + count * size].cast(code)
+
+	def close(self):
+		for column in self.__columns.values():
+			column.release()
+		self.__columns = {}
+		self.__view.release()
+		self.__map.close()
+		self.__fd.close()
+
+	def page_count(self):
+		return len(self.__columns["page_lines"]) - 1
+
+	def page(self, index):
+		c = self.__columns
+		page = primitives.Page(tuple(c["page_bbox"][index * 4:index * 4 + 4]))
+		for l in range(c["page_lines"][index], c["page_lines"][index + 1]):
+			chars = []
+			for i in range(c["line_chars"][l], c["line_chars"][l + 1]):
+				text = self.glyphs[c["char_text"][i]]
+				font = c["char_font"][i]
+				if font < 0:
+					chars.append(primitives.Anno(text))
+				else:
+					matrix = tuple(c["char_matrix"][i * 6:i * 6 + 6])
+					chars.append(primitives.Char(text, self.fonts[font], matrix, tuple(c["char_bbox"][i * 4:i * 4 + 4])))
+			page.text_lines.append(primitives.TextLine(tuple(c["line_bbox"][l * 4:l * 4 + 4]), chars))
+		for r in range(c["page_rects"][index], c["page_rects"][index + 1]):
+			page.rects.append(primitives.Shape(tuple(c["rect_bbox"][r * 4:r * 4 + 4])))
+		for k in range(c["page_curves"][index], c["page_curves"][index + 1]):
+			first, last = c["curve_points"][k], c["curve_points"][k + 1]
+			points = c["points"][first * 2:last * 2].tolist()
+			pts = [(points[j], points[j + 1]) for j in range(0, len(points), 2)]
+			page.curves.append(primitives.Shape(tuple(c["curve_bbox"][k * 4:k * 4 + 4]), pts))
+		return page
+
+	def pages(self):
+		for i in range(0, self.page_count()):
+			yield self.page(i)
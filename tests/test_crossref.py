@@ -0,0 +1,27 @@
+import crossref
+import prescan
+
+def texts(text, links):
+	return [(text[start:end], href) for start, end, href in links]
+
+def test_links():
+	linker = crossref.Linker({"ADD": "ADD.html", "ADDPD": "ADDPD.html", "PD": "PD.html", "MOVS": "MOVS.html"})
+	text = "ADDPD adds, unlike ADD or XADD; MOVSX is not MOVS."
+	assert texts(text, linker.links(text)) == [("ADDPD", "ADDPD.html"), ("ADD", "ADD.html"), ("MOVS", "MOVS.html")]
+	assert texts(text, linker.links(text, "ADD.html")) == [("ADDPD", "ADDPD.html"), ("MOVS", "MOVS.html")]
+	assert linker.links("add addpd") == []
+	assert linker.links("") == []
+
+def test_overlapping_names():
+	# the longest name wins, and a name inside it is not linked again
+	linker = crossref.Linker({"VPERMI2B": "a", "PERMI": "b", "I2B": "c", "VPERM": "d"})
+	text = "VPERMI2B and VPERM"
+	assert texts(text, linker.links(text)) == [("VPERMI2B", "a"), ("VPERM", "d")]
+
+def test_section_linker():
+	sections = [prescan.Section("MOVS/MOVSB—Move Data", 0, 2), prescan.Section("CMPS/MOVSB—Compare", 2, 3)]
+	linker = crossref.section_linker(sections)
+	text = "See MOVSB and CMPS."
+	# a name two sections share links to the first of them
+	assert texts(text, linker.links(text)) == [("MOVSB", "MOVS%3AMOVSB.html"), ("CMPS", "CMPS%3AMOVSB.html")]
+	assert crossref.page_href("MOVS/MOVSB") == "MOVS%3AMOVSB.html"
@@ -0,0 +1,66 @@
+from htmltext import HtmlText, OpenTag, CloseTag
+
+def pre_line(text):
+	line = HtmlText()
+	line.append(OpenTag("pre", True))
+	line.append(text)
+	line.autoclose()
+	return line
+
+def test_append_does_not_change_the_child():
+	line = pre_line("x")
+	page = HtmlText()
+	page.append(OpenTag("body"))
+	page.append(line)
+	page.append(line)
+	page.append(pre_line("y"))
+	assert page.to_html() == "\n<body>\n<pre>x\nx\ny</pre></body>"
+	assert line.to_html() == "\n<pre>x</pre>"
+
+def test_open_tag_reopens_the_last_element_of_a_child():
+	inner = HtmlText()
+	inner.append(pre_line("x"))
+	outer = HtmlText()
+	outer.append(inner)
+	outer.append(OpenTag("pre", True))
+	outer.append("z")
+	outer.autoclose()
+	assert outer.to_html() == "\n<pre>xz</pre>"
+	assert inner.to_html() == "\n<pre>x</pre>"
+
+def test_autoclose_rejects_crossed_tags():
+	text = HtmlText()
+	text.append(OpenTag("p"))
+	text.append(OpenTag("em"))
+	text.append(OpenTag("strong"))
+	text.append("a")
+	text.append(CloseTag("em"))
+	try:
+		text.autoclose()
+	except Exception as e:
+		assert str(e) == "autoclose mismatch"
+	else:
+		assert False
+
+def test_reopened_tag_keeps_its_place():
+	text = HtmlText()
+	text.append(OpenTag("p"))
+	text.append(OpenTag("em", True))
+	text.append("a")
+	text.append(CloseTag("em"))
+	text.append(OpenTag("strong"))
+	text.append(OpenTag("em", True))
+	text.append("b")
+	text.autoclose()
+	assert text.to_html() == "\n<p><em>a<strong>b</strong></em></p>"
+
+def test_unwrap_forgets_dropped_tags():
+	text = HtmlText()
+	text.append(OpenTag("div"))
+	text.append(OpenTag("p"))
+	text.append("a")
+	text.append(CloseTag("p"))
+	text.unwrap()
+	text.append("b")
+	text.autoclose()
+	assert text.to_html() == "\n<p>ab</p>"
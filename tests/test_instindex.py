@@ -0,0 +1,29 @@
+import instindex
+
+def paragraph(text):
+	return {"type": "paragraph", "runs": [{"text": text}]}
+
+def record(mnemonic, title, description):
+	return {"instruction": mnemonic, "title": title, "elements": [
+		{"type": "heading", "level": 1, "text": title},
+		{"type": "heading", "level": 2, "text": "Description"},
+		paragraph(description)]}
+
+def test_reindexing_replaces_an_instruction(tmp_path):
+	path = str(tmp_path / "index.db")
+	index = instindex.InstructionIndex(path)
+	index.add(record("ADDPD", "ADDPD—Add Packed Double", "Adds two packed values."))
+	index.add(record("XOR", "XOR—Logical Exclusive OR", "Exclusive or of two operands."))
+	index.add(record("ADDPD", "ADDPD—Add Packed Double", "Adds packed doubles, revised."))
+	index.close()
+
+	reader = instindex.IndexReader(path)
+	try:
+		assert [title for id, mnemonic, title, file in reader.instructions("addpd")] == ["ADDPD—Add Packed Double"]
+		assert reader.search("revised") == [("ADDPD", instindex.SECTION, "Description", "Adds packed doubles, [revised].")]
+		assert reader.search("values") == []
+		assert [row[0] for row in reader.search("exclusive")] == ["XOR", "XOR"]
+		count = reader.db.execute("SELECT count(*) FROM search").fetchone()[0]
+		assert count == 4
+	finally:
+		reader.close()
@@ -0,0 +1,56 @@
+import opcodetrie
+
+def paragraph(text):
+	return {"type": "paragraph", "runs": [{"text": text}]}
+
+# a record like the NDJSON ones, with one instruction table under the title
+def record(mnemonic, title, rows):
+	rows = [["Opcode", "Instruction", "Description"]] + rows
+	cells = []
+	for r in range(0, len(rows)):
+		for c in range(0, len(rows[r])):
+			cells.append({"row": r, "column": c, "content": [paragraph(rows[r][c])]})
+	table = {"type": "table", "rows": len(rows), "columns": 3, "section": title.lower(), "cells": cells}
+	return {"instruction": mnemonic, "title": title, "elements": [{"type": "heading", "level": 1, "text": title}, table]}
+
+def build(tmp_path):
+	builder = opcodetrie.OpcodeTrieBuilder()
+	builder.add(record("ADDPD", "ADDPD—Add Packed Double", [["66 0F 58 /r", "ADDPD xmm1, xmm2/m128", "Add."]]))
+	builder.add(record("VADDPD", "VADDPD—Add Packed Double", [["VEX.128.66.0F.WIG 58 /r", "VADDPD xmm1, xmm2, xmm3/m128", "Add."]]))
+	builder.add(record("MOV", "MOV—Move", [["B8+ rd id", "MOV r32, imm32", "Move."], ["REX.W + 8B /r", "MOV r64, r/m64", "Move."]]))
+	builder.add(record("LGDT", "LGDT—Load Global Descriptor Table", [["0F 01 /2", "LGDT m16&32", "Load."]]))
+	builder.add(record("ESC", "ESC—Two-byte Escape", [["0F", "ESC", "Escape."]]))
+	builder.add(record("TOP", "TOP—Near 0xFF", [["FC+rb", "TOP r8", "Top."]]))
+	path = str(tmp_path / "opcodes.bin")
+	builder.save(path)
+	return opcodetrie.OpcodeTrie(path)
+
+def test_round_trip(tmp_path):
+	trie = build(tmp_path)
+	try:
+		assert [m.file for m in trie.lookup(bytes([0x66, 0x0f, 0x58, 0xc1]))] == ["ADDPD.html"]
+		vex = trie.lookup(bytes([0x66, 0x0f, 0x58]), opcodetrie.VEX)
+		assert [(m.file, m.form, m.length, m.width) for m in vex] == [("VADDPD.html", "VADDPD xmm1, xmm2, xmm3/m128", 0, -1)]
+		for register in range(0, 8):
+			assert [m.form for m in trie.lookup(bytes([0xb8 + register]))] == ["MOV r32, imm32"]
+		assert [m.rex_w for m in trie.lookup(bytes([0x8b]))] == [True]
+		assert trie.lookup(bytes([0x0e])) == []
+	finally:
+		trie.close()
+
+def test_modrm_falls_back_to_shorter_prefix(tmp_path):
+	trie = build(tmp_path)
+	try:
+		assert [m.file for m in trie.lookup(bytes([0x0f, 0x01, 0x10]))] == ["LGDT.html"]
+		# ModR/M reg 3 is not LGDT's /2, which leaves the entry for 0F alone
+		assert [m.file for m in trie.lookup(bytes([0x0f, 0x01, 0xd8]))] == ["ESC.html"]
+	finally:
+		trie.close()
+
+def test_plus_register_stays_in_a_byte(tmp_path):
+	trie = build(tmp_path)
+	try:
+		assert [m.file for m in trie.lookup(bytes([0xff]))] == ["TOP.html"]
+		assert [len(key) for key in opcodetrie.parse_opcode("FC+rb")[0].keys()] == [2, 2, 2, 2]
+	finally:
+		trie.close()
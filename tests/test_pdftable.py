@@ -0,0 +1,119 @@
+import random
+import pdftable
+from pdftable import Rect
+
+# the pop-based clustering group_rects replaced
+def cluster_by_popping(lines, threshold=2):
+	lines = lines[:]
+	groups = []
+	while len(lines) > 0:
+		group = [lines.pop()]
+		i = 0
+		while i < len(group):
+			touching = [rect for rect in lines if group[i].intersects(rect, threshold)]
+			lines = [rect for rect in lines if not group[i].intersects(rect, threshold)]
+			group += touching
+			i += 1
+		groups.append(group)
+	return groups
+
+def random_lines(count, seed):
+	generator = random.Random(seed)
+	lines = []
+	for i in range(0, count):
+		x = generator.uniform(0, 600)
+		y = generator.uniform(0, 800)
+		length = generator.choice([0.5, 5, 40, 200])
+		if generator.random() < 0.5:
+			lines.append(Rect(x, y, x + length, y + 0.5))
+		else:
+			lines.append(Rect(x, y, x + 0.5, y + length))
+	return lines
+
+def test_group_rects_matches_popping():
+	for seed in range(0, 20):
+		lines = random_lines(80, seed)
+		expected = [sorted(id(rect) for rect in group) for group in cluster_by_popping(lines)]
+		groups = pdftable.group_rects(lines)
+		assert [sorted(id(rect) for rect in group) for group in groups] == expected
+		# rects inside a group keep their input order
+		for group in groups:
+			positions = [lines.index(rect) for rect in group]
+			assert positions == sorted(positions)
+
+def test_group_rects_cell_size():
+	lines = [Rect(0, 0, 100, 0.5), Rect(101, 0, 101.5, 50), Rect(300, 300, 301, 301)]
+	for cell_size in (None, 1, 8, 1000):
+		groups = pdftable.group_rects(lines, cell_size=cell_size)
+		assert sorted(len(group) for group in groups) == [1, 2]
+	assert pdftable.group_rects([]) == []
+
+def grid(columns, rows):
+	lines = [Rect(x - 0.25, rows[0], x + 0.25, rows[-1]) for x in columns]
+	lines += [Rect(columns[0], y - 0.25, columns[-1], y + 0.25) for y in rows]
+	return lines
+
+def test_table_places_items_by_pixel():
+	table = pdftable.Table(grid([0, 50, 100, 150], [0, 20, 40]))
+	assert (table.columns(), table.rows()) == (3, 2)
+	generator = random.Random(1)
+	points = [(generator.uniform(0, 149.9), generator.uniform(0, 39.9)) for i in range(0, 200)]
+	points += [(50, 20), (0, 0), (100, 39.9)]
+	table.add_at_pixels(points, lambda point: point)
+	one_by_one = pdftable.Table(grid([0, 50, 100, 150], [0, 20, 40]))
+	for point in points:
+		one_by_one.get_at_pixel(*point).append(point)
+	for row in range(0, 2):
+		for col in range(0, 3):
+			assert table.get_at(col, row) == one_by_one.get_at(col, row)
+	# a boundary belongs to the cell after it
+	assert (50, 20) in table.get_at(1, 1)
+	assert table.item_count() == len(points)
+
+class Box(object):
+	def __init__(self, rect): self.rect = rect
+	def bounds(self): return self.rect
+
+def random_boxes(count, seed):
+	generator = random.Random(seed)
+	boxes = []
+	for i in range(0, count):
+		x = generator.uniform(0, 500)
+		y = generator.uniform(0, 700)
+		boxes.append(Box(Rect(x, y, x + generator.uniform(1, 300), y + generator.uniform(1, 300))))
+	return boxes
+
+def test_rect_index_containing():
+	for node_size in (2, 8):
+		boxes = random_boxes(150, node_size)
+		index = pdftable.RectIndex(boxes, node_size)
+		assert len(index) == len(boxes)
+		for probe in random_boxes(50, 100 + node_size):
+			expected = [box for box in boxes if box.bounds().contains(probe.bounds())]
+			assert index.containing(probe.bounds()) == expected
+			smallest = min(expected, key=lambda box: box.bounds().area()) if len(expected) > 0 else None
+			assert index.innermost(probe.bounds()) == smallest
+
+def test_containment_tree_parents():
+	boxes = random_boxes(120, 7)
+	boxes.append(Box(Rect(10, 10, 20, 20)))
+	boxes.append(Box(Rect(10, 10, 20, 20)))
+	tree = pdftable.ContainmentTree(boxes)
+	by_area = sorted(boxes, key=lambda box: box.bounds().area())
+	for i in range(0, len(by_area)):
+		# the first item after it in area order that contains it
+		larger = [box for box in by_area[i + 1:] if box.bounds().contains(by_area[i].bounds())]
+		assert tree.parent(by_area[i]) is (larger[0] if len(larger) > 0 else None)
+	assert tree.roots() == [box for box in by_area if tree.parent(box) == None]
+	for box in boxes:
+		assert all(tree.parent(child) is box for child in tree.children(box))
+
+def test_table_merges_cells_across_missing_lines():
+	# the layout the original list-based grid gives for this table
+	columns = [Rect(x - 0.25, y1, x + 0.25, y2) for x, y1, y2 in [(0, 0, 60), (150, 0, 60), (50, 20, 60), (100, 0, 60)]]
+	rows = [Rect(x1, y - 0.25, x2, y + 0.25) for y, x1, x2 in [(0, 0, 150), (60, 0, 150), (20, 0, 150), (40, 0, 50), (40, 100, 150)]]
+	table = pdftable.Table(columns + rows)
+	assert (table.columns(), table.rows()) == (3, 3)
+	assert [[table.data_index(col, row) for col in range(0, 3)] for row in range(0, 3)] == [[0, 0, 1], [2, 3, 3], [3, 3, 4]]
+	assert table.cell_span(0, 0) == (2, 1)
+	assert table.cell_span(1, 1) == (2, 2)
@@ -0,0 +1,23 @@
+import prescan
+
+def test_instruction_titles():
+	for title in ["ADDPD—Add Packed Double Precision Floating-Point Values",
+			"MOVS/MOVSB/MOVSW/MOVSD/MOVSQ—Move Data From String to String",
+			"Jcc—Jump if Condition Is Met",
+			"INT n/INTO/INT3/INT1—Call to Interrupt Procedure",
+			"MOVDQA,VMOVDQA32/64—Move Aligned Packed Integer Values",
+			"VEXTRACTF128/VEXTRACTF32x4/VEXTRACTF64x2—Extract Packed Floating-Point Values",
+			"PREFETCHh–Prefetch Data Into Caches"]:
+		assert prescan.title_format__.match(title), title
+
+def test_chapter_titles():
+	for title in ["CHAPTER 3 INSTRUCTION SET REFERENCE, A-L",
+			"Instruction Set Reference, A-L",
+			"3.2 Instructions (A-L)",
+			"Volume 2A: Instruction Set Reference"]:
+		assert not prescan.title_format__.match(title), title
+
+def test_section_names():
+	section = prescan.Section("INT n/INTO/INT3/INT1—Call to Interrupt Procedure", 0, 1)
+	assert section.mnemonic() == "INT n/INTO/INT3/INT1"
+	assert section.names() == set(["INT N/INTO/INT3/INT1", "INT N", "INTO", "INT3", "INT1"])
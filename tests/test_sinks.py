@@ -0,0 +1,35 @@
+import os
+import sinks
+
+def test_archive_round_trip(tmp_path):
+	path = str(tmp_path / "pages.pack")
+	sink = sinks.ArchiveSink(path)
+	sink.write("ADDPD.html", "<p>ADDPD</p>")
+	sink.write("MOVS:MOVSB.html", "<p>é</p>")
+	sink.close()
+
+	# a second run appends, and its pages win
+	sink = sinks.ArchiveSink(path)
+	sink.write("ADDPD.html", "<p>ADDPD, again</p>")
+	sink.close()
+
+	reader = sinks.ArchiveReader(path)
+	try:
+		assert reader.names() == ["ADDPD.html", "MOVS:MOVSB.html"]
+		assert reader.read("ADDPD.html") == "<p>ADDPD, again</p>"
+		assert reader.read("MOVS:MOVSB.html") == "<p>é</p>"
+	finally:
+		reader.close()
+
+def test_threaded_sink_reports_failed_pages(tmp_path):
+	os.mkdir(str(tmp_path / "XOR.html"))
+	sink = sinks.ThreadedSink(sinks.DirectorySink(str(tmp_path)), 1)
+	for name in ("ADDPD.html", "XOR.html", "AND.html"):
+		sink.write(name, name)
+	failed = sink.failed(True)
+	assert [name for name, error in failed] == ["XOR.html"]
+	assert isinstance(failed[0][1], OSError)
+	assert sink.failed(True) == []
+	sink.close()
+	with open(str(tmp_path / "AND.html"), encoding="UTF-8") as fd:
+		assert fd.read() == "AND.html"
@@ -0,0 +1,50 @@
+import primitives
+import snapshot
+
+def sample_pages():
+	first = primitives.Page((0, 0, 612, 792))
+	first.text_lines.append(primitives.TextLine((45, 700, 120, 712), [
+		primitives.Char("A", "ABCDEF+NeoSansIntelMedium", (12, 0, 0, 12, 45, 700), (45, 700, 53, 712)),
+		primitives.Anno(" "),
+		primitives.Char("é", "ABCDEF+NeoSansIntel", (9, 0, 0, 9, 58, 700), (58, 700, 63, 709)),
+	]))
+	first.rects.append(primitives.Shape((40, 100, 560, 101)))
+	first.curves.append(primitives.Shape((10, 10, 30, 40), [(10, 10), (30, 40), (20, 25)]))
+	empty = primitives.Page((0, 0, 612, 792))
+	last = primitives.Page((0, 0, 612, 792))
+	last.rects.append(primitives.Shape((50, 200, 51, 400)))
+	return [first, empty, last]
+
+def chars(line):
+	return [(c.get_text(), getattr(c, "fontname", None), getattr(c, "matrix", None)) for c in line]
+
+def test_round_trip(tmp_path):
+	pages = sample_pages()
+	writer = snapshot.SnapshotWriter()
+	for page in pages:
+		writer.add_page(page)
+	path = str(tmp_path / "pages.snap")
+	writer.save(path)
+
+	cached = snapshot.Snapshot(path)
+	try:
+		assert cached.page_count() == len(pages)
+		for page, read in zip(pages, cached.pages()):
+			assert read.bbox == page.bbox
+			assert [l.bbox for l in read.text_lines] == [l.bbox for l in page.text_lines]
+			assert [chars(l) for l in read.text_lines] == [chars(l) for l in page.text_lines]
+			assert [r.bbox for r in read.rects] == [r.bbox for r in page.rects]
+			assert [(c.bbox, c.pts) for c in read.curves] == [(c.bbox, c.pts) for c in page.curves]
+		assert cached.page(2).rects[0].bbox == (50, 200, 51, 400)
+	finally:
+		cached.close()
+
+def test_rejects_other_files(tmp_path):
+	path = tmp_path / "other.snap"
+	path.write_bytes(b"not a snapshot at all")
+	try:
+		snapshot.Snapshot(str(path))
+	except Exception as e:
+		assert "not a page snapshot" in str(e)
+	else:
+		assert False
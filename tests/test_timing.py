@@ -0,0 +1,15 @@
+import timing
+
+def test_profiles_only_the_slowest_sections(tmp_path):
+	timer = timing.Timer(2)
+	replayed = []
+	for title, seconds in (("A", 3), ("B", 1), ("C", 5), ("D", 2)):
+		timer.keep_input(title)
+		timer.add("flush", seconds)
+		timer.end_section(title)
+	timer.profile_slowest(lambda data: lambda: replayed.append(data))
+	assert replayed == ["C", "A"]
+	path = str(tmp_path / "times.json")
+	timer.write(path)
+	assert [s.get("profile_file") != None for s in timer.sections] == [True, False, True, False]
+	assert all("input" not in s for s in timer.sections)
@@ -0,0 +1,54 @@
+import json
+import pdftable
+import primitives
+import x86manual
+
+def heading(*chars):
+	line = [primitives.Anno(" ")]
+	x = 45
+	for text in chars:
+		line.append(primitives.Char(text, "ABCDEF+NeoSansIntelMedium", (12, 0, 0, 12, x, 700), (x, 700, x + 8, 712)))
+		x += 8
+	return x86manual.CharCollection(line, pdftable.Rect(45, 92, x, 80))
+
+def test_leading_space_has_no_font():
+	line = heading("A", "D", "D")
+	# the last font interned must not leak into a line that starts with a space
+	x86manual.fonts__.intern("ABCDEF+NeoSansIntel-Italic")
+	assert line.texts[0] == " "
+	assert line.font_name() == "NeoSansIntelMedium"
+	assert line.font_size() == 12
+	assert line.first_style().font == "NeoSansIntelMedium"
+
+def test_prepended_spaces_have_no_font():
+	line = heading("M", "O", "V")
+	line.prepend_spaces(4)
+	x86manual.fonts__.intern("ABCDEF+NeoSansIntel-Bold")
+	assert str(line) == "     MOV "
+	assert line.font_name() == "NeoSansIntelMedium"
+	assert line.font_size() == 12
+	assert not line.first_style().bold
+
+def test_whitespace_only_line_is_empty():
+	line = x86manual.CharCollection([primitives.Anno(" "), primitives.Anno("\n")], pdftable.Rect(0, 0, 1, 1))
+	assert len(line) == 0
+	assert line.font_name() == ""
+	assert line.font_size() == 0
+	assert line.first_style() == None
+
+def text_line(y, chars):
+	items = []
+	x = 45
+	for text, font, size, rise in chars:
+		items.append(primitives.Char(text, "ABCDEF+" + font, (size, 0, 0, size, x, y - rise), (x, y - rise, x + size * 0.6, y - rise + size)))
+		x += size * 0.6
+	return x86manual.CharCollection(items, pdftable.Rect(45, y, x, y + 12))
+
+def test_json_scripts_are_smaller():
+	lines = x86manual.SortedRuns()
+	lines.add([text_line(80, [(c, "NeoSansIntelMedium", 12, 0) for c in "ADD—Add"]),
+		text_line(120, [("x", "Verdana", 9, 0), ("2", "Verdana", 6, 4), ("y", "Verdana", 9, 0), ("z", "Verdana", 9, 3)])])
+	record, line, files = x86manual.render_section(None, ([], [], lines), False, ("json",))
+	runs = json.loads(line)["elements"][1]["runs"]
+	# a run off the baseline is only a script when it is also smaller, as in the HTML
+	assert [(run["text"], run.get("script")) for run in runs] == [("x", None), ("2", "sub"), ("y", None), ("z", None)]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# Stage timings and primitive counts for --report. Times are wall-clock
+# seconds, kept per page and per instruction section. Stages nest: "flush"
+# includes "prepare_display", which includes "group_rects" and "tables", and
+# so on, so they do not add up to the total.
+
+import os
+import re
+import csv
+import json
+import time
+import marshal
+import cProfile
+
+class NullStage(object):
+	def __enter__(self): return self
+	def __exit__(self, *exc): return False
+
+null_stage__ = NullStage()
+
+# stands in for Timer when no report was asked for
+class NullTimer(object):
+	def stage(self, name): return null_stage__
+	def add(self, name, seconds): pass
+	def count(self, name, n=1): pass
+	def begin_page(self): pass
+	def end_page(self): pass
+	def end_section(self, title): return None
+	def keep_input(self, data): pass
+	def profile_slowest(self, replay): pass
+
+class Stage(object):
+	def __init__(self, timer, name):
+		self.timer = timer
+		self.name = name
+		self.start = 0
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.timer.add(self.name, time.perf_counter() - self.start)
+		return False
+
+def new_record():
+	return {"stages": {}, "counts": {}}
+
+def add_record(into, record):
+	for key in ("stages", "counts"):
+		for name, value in record[key].items():
+			into[key][name] = into[key].get(name, 0) + value
+
+class Timer(object):
+	def __init__(self, profile_count=0):
+		self.profile_count = profile_count
+		self.pages = []
+		self.sections = []
+		self.page = None
+		self.section = new_record()
+		self.__profiled = []
+
+	def stage(self, name): return Stage(self, name)
+
+	def add(self, name, seconds):
+		for record in (self.page, self.section):
+			if record != None:
+				record["stages"][name] = record["stages"].get(name, 0) + seconds
+
+	def count(self, name, n=1):
+		for record in (self.page, self.section):
+			if record != None:
+				record["counts"][name] = record["counts"].get(name, 0) + n
+
+	def begin_page(self):
+		self.page = new_record()
+		self.page["page"] = len(self.pages) + 1
+
+	def end_page(self):
+		self.pages.append(self.page)
+		self.page = None
+
+	def end_section(self, title):
+		section = self.section
+		section["title"] = title
+		self.sections.append(section)
+		self.section = new_record()
+		# a section rendered in another process is ranked once its flush
+		# time is merged
+		if "flush" in section["stages"]:
+			self.__keep_input(section)
+		return section
+
+	# Adds the timings of a section rendered in another process to the record
+	# that end_section returned for it.
+	def merge_section(self, section, record):
+		add_record(section, record)
+		self.__keep_input(section)
+
+	# Time spent getting the last page from pdfminer (or a snapshot, or the
+	# layout workers). When the parser is fed from inside pdfminer, its own
+	# time on the page is taken out.
+	def interpreted(self, seconds, includes_parser):
+		page = self.pages[-1]
+		if includes_parser:
+			seconds -= page["stages"].get("process_page", 0) + page["stages"].get("flush", 0)
+		page["stages"]["interpret"] = page["stages"].get("interpret", 0) + seconds
+		self.section["stages"]["interpret"] = self.section["stages"].get("interpret", 0) + seconds
+
+	# Sections are timed without the profiler, which would skew which ones
+	# are slowest. With --profile, the parser hands over what it needs to
+	# flush each section again; the input of the N slowest is kept, and
+	# profile_slowest replays just those under cProfile.
+	def keep_input(self, data):
+		if self.profile_count > 0:
+			self.section["input"] = data
+
+	def __keep_input(self, section):
+		if "input" not in section: return
+		self.__profiled.append(section)
+		self.__profiled.sort(key=lambda s: -s["stages"].get("flush", 0))
+		for dropped in self.__profiled[self.profile_count:]:
+			del dropped["input"]
+		del self.__profiled[self.profile_count:]
+
+	# replay(data) returns a function that flushes the section again
+	def profile_slowest(self, replay):
+		for section in self.__profiled:
+			if "input" not in section: continue
+			function = replay(section.pop("input"))
+			profile = cProfile.Profile()
+			try:
+				profile.runcall(function)
+			finally:
+				profile.create_stats()
+				section["profile"] = profile.stats
+
+	def totals(self):
+		total = new_record()
+		for section in self.sections:
+			add_record(total, section)
+		add_record(total, self.section)
+		return total
+
+	def write(self, path):
+		base = os.path.splitext(path)[0]
+		for section in self.__profiled:
+			if "profile" not in section: continue
+			name = re.sub(r"[^A-Za-z0-9_.-]+", "_", section.get("title", "section"))[:40]
+			section["profile_file"] = "%s-%s.prof" % (base, name)
+			with open(section["profile_file"], "wb") as fd:
+				marshal.dump(section["profile"], fd)
+
+		sections = [dict((k, v) for k, v in s.items() if k not in ("profile", "input")) for s in self.sections]
+		if path.endswith(".csv"):
+			self.__write_csv(path, sections)
+		else:
+			with open(path, "w") as fd:
+				json.dump({"totals": self.totals(), "sections": sections, "pages": self.pages}, fd, indent=1)
+
+	def __write_csv(self, path, sections):
+		stages = sorted(set(name for record in self.pages + sections for name in record["stages"]))
+		counts = sorted(set(name for record in self.pages + sections for name in record["counts"]))
+		with open(path, "w", newline="") as fd:
+			writer = csv.writer(fd)
+			writer.writerow(["kind", "id"] + [name + "_seconds" for name in stages] + counts)
+			for kind, records in (("page", self.pages), ("section", sections)):
+				for record in records:
+					ident = record.get("page", record.get("title", ""))
+					row = [kind, ident]
+					row += ["%.6f" % record["stages"].get(name, 0) for name in stages]
+					row += [record["counts"].get(name, 0) for name in counts]
+					writer.writerow(row)
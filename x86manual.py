@@ -5,19 +5,52 @@ import pdftable
 from htmltext import *
 import sys
 import math
+import array
+import heapq
+import io
+import json
+import pickle
+import collections
+import time
+import timing
+import crossref
+import sinks
 import re
 
 def escape_html(a):
 	return a.replace("<", "&lt;").replace(">", "&gt;").replace("&", "&amp;")
 
-def sort_topdown_ltr(a, b):
-	aa = a.bounds()
-	bb = b.bounds()
-	if aa.y1() < bb.y1(): return -1
-	if aa.y1() > bb.y1(): return 1
-	if aa.x1() < bb.x1(): return -1
-	if aa.x1() > bb.x1(): return 1
-	return 0
+def topdown_ltr_key(item):
+	bounds = item.bounds()
+	return (bounds.y1, bounds.x1)
+
+# sorts in place, top-down then left to right, unless items already are
+def sort_topdown_ltr(items):
+	last = None
+	for item in items:
+		key = topdown_ltr_key(item)
+		if last != None and key < last:
+			items.sort(key=topdown_ltr_key)
+			break
+		last = key
+	return items
+
+# The text lines of an instruction, as one sorted run per page. Pages come in
+# order, so merging the runs is cheap.
+class SortedRuns(object):
+	def __init__(self):
+		self.runs = []
+	
+	def add(self, run):
+		if len(run) > 0: self.runs.append(run)
+	
+	def first(self): return self.runs[0][0]
+	
+	def __len__(self): return sum(len(run) for run in self.runs)
+	
+	def __iter__(self):
+		if len(self.runs) == 1: return iter(self.runs[0])
+		return heapq.merge(*self.runs, key=topdown_ltr_key)
 
 class SingleCellTable(pdftable.TableBase):
 	def __init__(self, data):
@@ -36,7 +69,7 @@ class SingleCellTable(pdftable.TableBase):
 		return self.__data
 	
 	def get_at_pixel(self, x, y):
-		if self.rect.x1() <= x and self.rect.x2() >= x and self.rect.y1() <= y and self.rect.y2() >= y:
+		if self.rect.x1 <= x and self.rect.x2 >= x and self.rect.y1 <= y and self.rect.y2 >= y:
 			return self.__data
 		return None
 	
@@ -52,24 +85,24 @@ def center_aligned_table(source):
 	assert source.rows() == 1 and source.columns() == 1
 	bounds = source.bounds()
 	contents = source.get_at(0, 0)[:]
-	contents.sort(cmp=sort_topdown_ltr)
+	sort_topdown_ltr(contents)
 	column_centers = []
-	last_y = contents[0].bounds().y1()
+	last_y = contents[0].bounds().y1
 	for item in contents:
-		if not pdftable.pretty_much_equal(last_y, item.bounds().y1()): break
+		if not pdftable.pretty_much_equal(last_y, item.bounds().y1): break
 		column_centers.append(item.bounds().xmid())
 	
 	table = []
 	row = [[]] * len(column_centers)
 	for item in contents:
 		item_bounds = item.bounds()
-		if not pdftable.pretty_much_equal(item_bounds.y1(), last_y):
+		if not pdftable.pretty_much_equal(item_bounds.y1, last_y):
 			if any(len(c) == 0 for c in row):
 				for i in range(0, len(column_centers)):
 					table[-1][i] += row[i]
 			else: table.append(row)
 			row = [[]] * len(column_centers)
-			last_y = item_bounds.y1()
+			last_y = item_bounds.y1
 		
 		col_index = None
 		min_dist = float("inf")
@@ -92,32 +125,32 @@ def left_aligned_table(source):
 	assert source.rows() == 1 and source.columns() == 1
 	bounds = source.bounds()
 	contents = source.get_at(0, 0)[:]
-	contents.sort(cmp=sort_topdown_ltr)
+	sort_topdown_ltr(contents)
 	
 	table = []
 	row = []
 	columns = []
-	last_y = contents[0].bounds().y1()
+	last_y = contents[0].bounds().y1
 	for item in contents:
 		item_bounds = item.bounds()
-		if not pdftable.pretty_much_equal(item_bounds.y1(), last_y):
+		if not pdftable.pretty_much_equal(item_bounds.y1, last_y):
 			break
-		columns.append(item_bounds.x1())
+		columns.append(item_bounds.x1)
 	
-	last_y = contents[0].bounds().y1()
+	last_y = contents[0].bounds().y1
 	row = [[]] * len(columns)
 	for item in contents:
 		item_bounds = item.bounds()
-		if not pdftable.pretty_much_equal(item_bounds.y1(), last_y):
+		if not pdftable.pretty_much_equal(item_bounds.y1, last_y):
 			if any(len(c) == 0 for c in row):
 				for i in range(0, len(columns)):
 					table[-1][i] += row[i]
 			else: table.append(row)
 			row = [[]] * len(columns)
-			last_y = item_bounds.y1()
+			last_y = item_bounds.y1
 		
 		for i in range(0, len(columns)):
-			if pdftable.pretty_much_equal(item_bounds.x1(), columns[i]):
+			if pdftable.pretty_much_equal(item_bounds.x1, columns[i]):
 				col_index = i
 				break
 		else:
@@ -134,68 +167,209 @@ def left_aligned_table(source):
 	
 	return pdftable.ImplicitTable(bounds, table)
 
-class FakeChar(object):
-	def __init__(self, t):
-		self.text = t
+# Font names are stored once; characters refer to them by index.
+class FontTable(object):
+	def __init__(self):
+		self.names = []
+		self.short_names = []
+		self.ids = {}
+		self.bold = []
+		self.italic = []
+		self.last = []
 	
-	def get_text(self):
-		return self.text
+	def intern(self, name):
+		font = self.ids.get(name)
+		if font == None:
+			font = len(self.names)
+			self.ids[name] = font
+			self.names.append(name)
+			self.short_names.append(name[7:])
+			self.bold.append(name[7:].find("Bold") != -1)
+			self.italic.append(name[7:].find("Italic") != -1)
+			self.last.append(None)
+		return font
+	
+	# Sizes and baselines vary too much to keep a style for each; only the
+	# last style of each font is reused, since runs of a line mostly repeat it.
+	def style(self, font, size, baseline):
+		style = self.last[font]
+		if style == None or style.size != size or style.baseline != baseline:
+			style = FontStyle(self.short_names[font], size, baseline, self.bold[font], self.italic[font])
+			self.last[font] = style
+		return style
+
+fonts__ = FontTable()
 
+# Characters are kept in parallel arrays instead of as pdfminer objects, so a
+# page's layout can be freed as soon as its lines are collected. Font id -1
+# marks whitespace that has no font (layout spaces, indentation).
 class CharCollection(object):
+	__slots__ = ("texts", "fonts", "sizes", "baselines", "rect", "approx_rect", "__text")
+	
 	def __init__(self, iterable, rect):
-		self.chars = [c for c in iterable]
-		while len(self.chars) > 0 and len(self.chars[-1].get_text().strip()) == 0:
-			self.chars.pop()
+		chars = [c for c in iterable]
+		while len(chars) > 0 and len(chars[-1].get_text().strip()) == 0:
+			chars.pop()
+		
+		self.texts = []
+		self.fonts = array.array("i")
+		self.sizes = array.array("d")
+		self.baselines = array.array("d")
+		for c in chars:
+			self.texts.append(c.get_text())
+			if hasattr(c, "matrix"):
+				self.fonts.append(fonts__.intern(c.fontname))
+				self.sizes.append(c.matrix[0])
+				self.baselines.append(c.matrix[5])
+			else:
+				self.fonts.append(-1)
+				self.sizes.append(0)
+				self.baselines.append(0)
+		self.__text = None
 		
 		# actual, complete bounds (modified by caller)
 		self.rect = rect
 		# bounds excluding abnormally-placed characters (exponents, symbols)
-		self.approx_rect = self.__approximative_bounds()
+		self.approx_rect = self.__approximative_bounds(chars)
 	
 	def bounds(self): return self.approx_rect
 	
-	def __approximative_bounds(self):
-		if len(self.chars) == 0: return self.rect
+	def __approximative_bounds(self, chars):
+		if len(chars) == 0: return self.rect
 		size = self.font_size()
 		approx = None
-		for c in self.chars:
+		for c in chars:
 			if hasattr(c, "matrix") and c.matrix[0] == size:
 				rect = pdftable.Rect(c.x0, c.y1, c.x1, c.y0)
 				if approx == None: approx = rect
-				elif approx.y1() == rect.y1(): approx = approx.union(rect)
+				elif approx.y1 == rect.y1: approx = approx.union(rect)
 		return approx
 	
+	def __len__(self): return len(self.texts)
+	
+	def copy(self):
+		result = CharCollection([], self.rect)
+		result.texts = self.texts[:]
+		result.fonts = array.array("i", self.fonts)
+		result.sizes = array.array("d", self.sizes)
+		result.baselines = array.array("d", self.baselines)
+		result.approx_rect = self.approx_rect
+		return result
+	
 	def append(self, line):
 		self.rect = self.rect.union(line.rect)
 		self.approx_rect = self.approx_rect.union(line.approx_rect)
-		self.chars += line.chars
-		while len(self.chars[-1].get_text().strip()) == 0:
-			self.chars.pop()
+		self.texts += line.texts
+		self.fonts += line.fonts
+		self.sizes += line.sizes
+		self.baselines += line.baselines
+		count = len(self.texts)
+		while len(self.texts[count - 1].strip()) == 0:
+			count -= 1
+		self.__truncate(count)
+		self.__text = None
 	
 	def append_char(self, c):
-		aChar = self.chars[0]
-		self.chars.append(FakeChar(c))
+		self.texts.append(c)
+		self.fonts.append(-1)
+		self.sizes.append(0)
+		self.baselines.append(0)
+		self.__text = None
+	
+	def prepend_spaces(self, count):
+		self.texts[:0] = [" "] * count
+		self.fonts[:0] = array.array("i", [-1] * count)
+		self.sizes[:0] = array.array("d", [0] * count)
+		self.baselines[:0] = array.array("d", [0] * count)
+		self.__text = None
+	
+	def drop_chars(self, count):
+		del self.texts[:count]
+		del self.fonts[:count]
+		del self.sizes[:count]
+		del self.baselines[:count]
+		self.__text = None
+	
+	def __truncate(self, count):
+		del self.texts[count:]
+		del self.fonts[count:]
+		del self.sizes[count:]
+		del self.baselines[count:]
+	
+	# index of the first character that has a font, or None
+	def __first_font(self):
+		for i in range(0, len(self.fonts)):
+			if self.fonts[i] != -1: return i
+		return None
 	
+	def first_style(self):
+		i = self.__first_font()
+		if i == None: return None
+		return fonts__.style(self.fonts[i], self.sizes[i], self.baselines[i])
+	
+	# (style, text) for each run of characters that share a style. Characters
+	# without a font join the run before them; a leading run of them has no
+	# style.
+	def style_runs(self):
+		runs = []
+		key = None
+		start = 0
+		for i in range(0, len(self.texts)):
+			if self.fonts[i] == -1: continue
+			this_key = (self.fonts[i], self.sizes[i], self.baselines[i])
+			if this_key != key:
+				if i > start:
+					runs.append((None if key == None else fonts__.style(*key), "".join(self.texts[start:i])))
+				key = this_key
+				start = i
+		if len(self.texts) > start:
+			runs.append((None if key == None else fonts__.style(*key), "".join(self.texts[start:])))
+		return runs
+	
+	# font and size of the first character that has a font, not of leading
+	# whitespace
 	def font_name(self):
-		return self.chars[0].fontname[7:] if len(self.chars) != 0 else ""
+		i = self.__first_font()
+		return fonts__.short_names[self.fonts[i]] if i != None else ""
 	
 	def font_size(self):
-		return self.chars[0].matrix[0] if len(self.chars) != 0 else 0
+		i = self.__first_font()
+		return self.sizes[i] if i != None else 0
 	
 	def __str__(self):
-		uni = "".join([c.get_text() for c in self.chars])
-		if len(uni) > 0 and uni[-1] != "-" and uni[-1] != "/":
-			uni += " "
-		return uni
+		if self.__text == None:
+			uni = "".join(self.texts)
+			if len(uni) > 0 and uni[-1] != "-" and uni[-1] != "/":
+				uni += " "
+			self.__text = uni
+		return self.__text
 	
 	def __repr__(self):
 		return "<%r text=%r>" % (self.rect, str(self))
+	
+	# font ids only mean something to the process that interned them
+	def __getstate__(self):
+		names = {}
+		for font in self.fonts:
+			if font != -1 and font not in names:
+				names[font] = fonts__.names[font]
+		return (self.texts, names, self.fonts, self.sizes, self.baselines, self.rect, self.approx_rect)
+	
+	def __setstate__(self, state):
+		self.texts, names, fonts, self.sizes, self.baselines, self.rect, self.approx_rect = state
+		local = dict((font, fonts__.intern(name)) for font, name in names.items())
+		self.fonts = array.array("i", [local.get(font, -1) for font in fonts])
+		self.__text = None
 
 class FontStyle(object):
-	def __init__(self, char):
-		self.font = char.fontname[7:]
-		self.size = char.matrix[0]
-		self.baseline = char.matrix[5]
+	__slots__ = ("font", "size", "baseline", "bold", "italic")
+	
+	def __init__(self, font, size, baseline, bold, italic):
+		self.font = font
+		self.size = size
+		self.baseline = baseline
+		self.bold = bold
+		self.italic = italic
 	
 	def font_is(self, name):
 		return self.font.find(name) != -1
@@ -212,77 +386,230 @@ class FontStyle(object):
 fpu_flags_format__ = re.compile(r"^C[0-9]")
 exceptions_format__ = re.compile(r"^#?[A-Z]{2}")
 
+render_linker__ = None
+
+# Render pool initializer: the cross-reference linker is sent to each process
+# once instead of with every section.
+def init_render_process(linker):
+	global render_linker__
+	render_linker__ = linker
+
+# Runs in a render pool process: lays out and writes one instruction from the
+# rects, curves and text lines that x86ManParser collected for it.
+# Returns the section's timings when timed, and its JSON line, which the main
+# process writes so that lines are never interleaved. Without an outputDir
+# (the main process writes to an archive), the pages are returned as well.
+def render_section(outputDir, section, timed=False, formats=("html",)):
+	timer = timing.Timer() if timed else None
+	jsonOutput = io.StringIO() if "json" in formats else None
+	sink = sinks.DirectorySink(outputDir) if outputDir != None else sinks.MemorySink()
+	parser = x86ManParser(outputDir, None, timer=timer, formats=formats, jsonOutput=jsonOutput, linker=render_linker__, sink=sink)
+	parser.ltRects, parser.curves, parser.textLines = section
+	parser.flush()
+	return (timer.section if timed else None, jsonOutput.getvalue() if jsonOutput != None else None, sink.files if outputDir == None else None)
+
+def json_rect(rect):
+	return [round(float(rect.x1), 3), round(float(rect.y1), 3), round(float(rect.x2), 3), round(float(rect.y2), 3)]
+
 class x86ManParser(object):
-	def __init__(self, outputDir, laParams):
+	# formats holds "html", "json" or both; JSON lines go to jsonOutput and,
+	# as records, to the add() method of each of recordSinks (an
+	# instindex.InstructionIndex, an opcodetrie.OpcodeTrieBuilder). A
+	# crossref.Linker links the instructions that HTML paragraphs mention.
+	# Pages go to sink, by default a sinks.DirectorySink of outputDir.
+	def __init__(self, outputDir, laParams, renderPool=None, memoryBudget=None, timer=None, formats=("html",), jsonOutput=None, recordSinks=(), linker=None, sink=None):
 		self.outputDir = outputDir
+		self.sink = sink if sink != None else sinks.DirectorySink(outputDir)
 		self.laParams = laParams
+		self.renderPool = renderPool
+		self.memoryBudget = memoryBudget
+		self.timer = timer if timer != None else timing.NullTimer()
+		# the per-primitive hooks skip their clock reads without a report
+		self.__timed = isinstance(self.timer, timing.Timer)
+		self.__profiling = self.__timed and self.timer.profile_count > 0
+		self.formats = formats
+		self.jsonOutput = jsonOutput
+		self.recordSinks = recordSinks
+		self.linker = linker
+		self.__page_href = None
+		if len(recordSinks) > 0 and "json" not in formats:
+			self.formats = formats + ("json",)
+		self.__page_time = 0
 		self.yBase = 0
 		self.success = 0
 		self.fail = 0
+		# pages of the sections counted in success, until the sink has
+		# written them
+		self.__written = collections.Counter()
+		self.__page_names = []
+		self.__rendering = []
 		
 		self.ltRects = []
 		self.curves = []
-		self.textLines = []
+		self.textLines = SortedRuns()
 		self.thisPageLtRects = []
 		self.thisPageTextLines = []
 		self.__title_stack = []
 		self.__is_code = False
 	
 	def flush(self):
+		if self.__profiling:
+			self.timer.keep_input(pickle.dumps((self.ltRects, self.curves, self.textLines)))
+		with self.timer.stage("flush"):
+			self.__flush()
+	
+	def __flush(self):
+		self.__page_names = []
 		try:
-			displayable = self.__prepare_display()
+			with self.timer.stage("prepare_display"):
+				displayable = self.__prepare_display()
 		except:
-			print(("Failed to prepare for %s" % str(self.textLines[0])))
+			print(("Failed to prepare for %s" % str(self.textLines.first())))
 			raise
 		
-		self.__output_file(displayable)
+		# the HTML output changes the model as it goes, so JSON comes first
+		if "json" in self.formats:
+			self.__output_json(displayable)
+		if "html" in self.formats:
+			self.__output_file(displayable)
+	
+	# waits for the instructions handed to the render pool, then for the
+	# sink to write every page. After the render pool was terminated, the
+	# renders it never finished count as failed instead of being waited for.
+	def finish(self, abandoned=False):
+		self.__collect_renders(not abandoned)
+		self.fail += len(self.__rendering)
+		self.__rendering = []
+		self.__count_failed_writes()
+		self.timer.profile_slowest(self.__replay)
+	
+	# flushes a section kept for the profiler again, throwing the output away
+	def __replay(self, data):
+		jsonOutput = io.StringIO() if "json" in self.formats else None
+		parser = x86ManParser(None, None, formats=self.formats, jsonOutput=jsonOutput, linker=self.linker, sink=sinks.MemorySink())
+		parser.ltRects, parser.curves, parser.textLines = pickle.loads(data)
+		return parser.flush
+	
+	def __succeeded(self, names):
+		self.success += 1
+		for name in names: self.__written[name] += 1
+	
+	# A page the sink could not write moves its section from success to fail.
+	# (The last section is flushed without being counted.)
+	def __count_failed_writes(self):
+		for name, error in self.sink.failed(True):
+			print(("*** couldn't write %s: %s" % (self.sink.location(name), error)))
+			if self.__written[name] > 0:
+				self.__written[name] -= 1
+				self.success -= 1
+				self.fail += 1
+		self.__written.clear()
+	
+	def __collect_renders(self, wait):
+		while len(self.__rendering) > 0 and (wait or self.__rendering[0][0].ready()):
+			result, section = self.__rendering.pop(0)
+			if __debug__:
+				record, line, files = result.get()
+				self.__succeeded([name for name, text in files or []])
+			else:
+				try:
+					record, line, files = result.get()
+					self.__succeeded([name for name, text in files or []])
+				except:
+					print("*** couldn't flush to disk")
+					self.fail += 1
+					record, line, files = None, None, None
+			if record != None and section != None:
+				self.timer.merge_section(section, record)
+			if files != None:
+				for name, text in files: self.sink.write(name, text)
+			if line != None:
+				self.__write_record(line)
 	
 	def begin_page(self, page):
+		self.timer.begin_page()
+		self.__page_time = 0
 		self.thisPageLtRects = []
 		self.thisPageTextLines = []
 		self.yBase += page.bbox[3] - page.bbox[1]
 	
 	def end_page(self, page):
+		start = time.perf_counter() if self.__timed else 0
+		flushed = 0
 		if len(self.thisPageTextLines) > 0:
-			self.thisPageTextLines.sort(cmp=sort_topdown_ltr)
+			sort_topdown_ltr(self.thisPageTextLines)
 			firstLine = self.thisPageTextLines[0]
 			if firstLine.font_name() == "NeoSansIntelMedium" and firstLine.font_size() >= 12:
 				if len(self.ltRects) > 0 or len(self.textLines) > 0:
 					# convenience: if we're debugging, let an exception crash
 					# the script
-					if __debug__:
-						self.flush()
-						self.success += 1
+					flush_start = time.perf_counter() if self.__timed else 0
+					if self.renderPool != None:
+						section = (self.ltRects, self.curves, self.textLines)
+						if self.__profiling: self.timer.keep_input(pickle.dumps(section))
+						result = self.renderPool.apply_async(render_section, (self.sink.directory(), section, self.__timed, self.formats))
+						self.__rendering.append((result, self.timer.end_section(self.section_title())))
+						self.__collect_renders(False)
 					else:
-						try:
+						if __debug__:
 							self.flush()
-							self.success += 1
-						except:
-							print("*** couldn't flush to disk")
-							self.fail += 1
+							self.__succeeded(self.__page_names)
+						else:
+							try:
+								self.flush()
+								self.__succeeded(self.__page_names)
+							except:
+								print("*** couldn't flush to disk")
+								self.fail += 1
+						self.timer.end_section(self.section_title())
+					if self.__timed: flushed = time.perf_counter() - flush_start
+					
+					if self.memoryBudget != None:
+						self.memoryBudget.end_section(self.section_title())
 					
 					self.ltRects = []
 					self.curves = []
-					self.textLines = []
+					self.textLines = SortedRuns()
 		
 		self.ltRects += self.thisPageLtRects
-		self.textLines += self.thisPageTextLines
+		self.textLines.add(self.thisPageTextLines)
+		if self.__timed:
+			self.timer.count("text_lines", len(self.thisPageTextLines))
+			self.timer.count("chars", sum(len(line) for line in self.thisPageTextLines))
+			self.timer.count("rects", len(self.thisPageLtRects))
+			self.timer.add("process_page", self.__page_time + time.perf_counter() - start - flushed)
+		self.timer.end_page()
+		if self.memoryBudget != None:
+			self.memoryBudget.check(self.section_title())
+	
+	def section_title(self):
+		if len(self.textLines) == 0: return "(untitled section)"
+		return str(self.textLines.first()).strip()
 	
 	def process_text_line(self, line):
+		start = time.perf_counter() if self.__timed else 0
 		# ignore header and footer
 		if line.bbox[1] < 740 and line.bbox[1] > 50:
 			coll = CharCollection(line, self.__fix_bbox(line.bbox))
 			coll.approx_rect = self.__fix_rect(coll.approx_rect)
-			if len(coll.chars) > 0:
+			if len(coll) > 0:
 				self.thisPageTextLines.append(coll)
+		if self.__timed: self.__page_time += time.perf_counter() - start
 	
 	def process_rect(self, rect):
 		if rect.bbox[1] < 740 and rect.bbox[1] > 50:
 			self.thisPageLtRects.append(self.__fix_bbox(rect.bbox))
 	
 	def process_curve(self, curve):
+		start = time.perf_counter() if self.__timed else 0
+		# streaming mode keeps nothing from the header and footer
+		if self.memoryBudget != None and not (curve.bbox[1] < 740 and curve.bbox[1] > 50):
+			return
 		curve = pdftable.Curve([self.__fix_point(p) for p in curve.pts])
 		self.curves.append(curve)
+		if self.__timed:
+			self.timer.count("curves")
+			self.__page_time += time.perf_counter() - start
 	
 	def process_item(self, item, n=0):
 		if isinstance(item, LTTextLineHorizontal):
@@ -305,34 +632,34 @@ class x86ManParser(object):
 		return (p[0], self.yBase - p[1])
 	
 	def __fix_rect(self, r):
-		return pdftable.Rect(r.x1(), self.yBase - r.y1(), r.x2(), self.yBase - r.y2())
+		return pdftable.Rect(r.x1, self.yBase - r.y1, r.x2, self.yBase - r.y2)
 	
 	def __fix_bbox(self, bbox):
 		return self.__fix_rect(pdftable.Rect(bbox[0], bbox[3], bbox[2], bbox[1]))
 	
 	def __merge_text(self, lines):
 		def sort_text(a, b):
-			if pdftable.pretty_much_equal(a.rect.x1(), b.rect.x1()):
-				if a.rect.y1() < b.rect.y1():
+			if pdftable.pretty_much_equal(a.rect.x1, b.rect.x1):
+				if a.rect.y1 < b.rect.y1:
 					return -1
-				if a.rect.y1() == b.rect.y1():
+				if a.rect.y1 == b.rect.y1:
 					return 1
 				return 0
-			if a.rect.x1() < b.rect.x1():
+			if a.rect.x1 < b.rect.x1:
 				return -1
 			return 1
 		
 		if len(lines) == 0: return
 		
-		lines.sort(cmp=sort_topdown_ltr)
+		sort_topdown_ltr(lines)
 		merged = [lines[0]]
 		for line in lines[1:]:
 			last = merged[-1]
-			same_x = pdftable.pretty_much_equal(line.rect.x1(), last.rect.x1())
+			same_x = pdftable.pretty_much_equal(line.rect.x1, last.rect.x1)
 			same_size = last.font_size() == line.font_size()
-			decent_descent = line.approx_rect.y1() - last.approx_rect.y2() < 1.2
+			decent_descent = line.approx_rect.y1 - last.approx_rect.y2 < 1.2
 			if same_x and same_size and decent_descent:
-				lastChar = last.chars[-1].get_text()[-1]
+				lastChar = last.texts[-1][-1]
 				if not (lastChar == "-" or lastChar == "/"):
 					last.append_char(" ")
 				last.append(line)
@@ -340,21 +667,31 @@ class x86ManParser(object):
 				merged.append(line)
 		return merged
 	
-	def __output_file(self, displayable):
+	def __title(self, displayable):
 		title_parts = [p.strip() for p in re.split(r"\s*[-—]\s*", str(displayable[0]), 1)]
 		if len(title_parts) != 2:
 			print((displayable[0].font_size(), str(displayable[0:5])))
 			print(title_parts)
 			raise Exception("Can't decode title")
-		
-		title = title_parts[0]
-		path = "%s/%s.html" % (self.outputDir, title.replace("/", ":"))
-		print(("Writing to %s" % path))
-		file_data = self.__output_page(displayable).encode("UTF-8")
-		with open(path, "w") as fd:
-			fd.write(file_data)
+		return title_parts[0]
 	
-	def __output_page(self, displayable):
+	def __output_file(self, displayable):
+		title = self.__title(displayable)
+		if self.linker != None:
+			self.__page_href = crossref.page_href(title)
+		name = "%s.html" % title.replace("/", ":")
+		print(("Writing to %s" % self.sink.location(name)))
+		page = io.StringIO()
+		self.__output_page(displayable, page)
+		# sections still in the render pool come first
+		self.__collect_renders(True)
+		# the whole write for a plain sink, the wait for room in the queue
+		# for a sinks.ThreadedSink
+		with self.timer.stage("sink"):
+			self.sink.write(name, page.getvalue())
+		self.__page_names.append(name)
+	
+	def __output_page(self, displayable, fd):
 		title = str(displayable[0])
 		result = [""]
 		text = HtmlText()
@@ -368,10 +705,13 @@ class x86ManParser(object):
 		text.append(CloseTag("head"))
 		text.append(OpenTag("body"))
 		
-		for element in displayable:
-			text.append(self.__output_html(element))
+		with self.timer.stage("output_page"):
+			for element in displayable:
+				text.append(self.__output_html(element))
 		
-		return "<!DOCTYPE html>\n" + text.to_html()
+		with self.timer.stage("write"):
+			fd.write("<!DOCTYPE html>\n")
+			text.write_html(fd)
 	
 	def __output_html(self, element):
 		if isinstance(element, list):
@@ -394,7 +734,7 @@ class x86ManParser(object):
 			for item in element.items:
 				item_result = self.__output_html(item)
 				if item_result.tokens[0].tag == "p":
-					item_result.tokens = item_result.tokens[1:-1]
+					item_result.unwrap()
 				result.append(OpenTag("li"))
 				result.append(item_result)
 				result.append(CloseTag("li"))
@@ -417,7 +757,7 @@ class x86ManParser(object):
 				attribs = {
 					"width": bounds.width() * 1.5,
 					"height": bounds.height() * 1.5,
-					"viewBox": "%f %f %f %f" % (bounds.x1(), bounds.y1(), bounds.width(), bounds.height())
+					"viewBox": "%f %f %f %f" % (bounds.x1, bounds.y1, bounds.width(), bounds.height())
 				}
 				svg.append(OpenTag("svg", attributes=attribs))
 				for item in flat:
@@ -428,19 +768,7 @@ class x86ManParser(object):
 		if isinstance(element, pdftable.TableBase):
 			result = HtmlText()
 			print_index = -1
-			attributes = {}
-			if element.rows() == 1 and element.columns() == 1:
-				if len(self.__title_stack) == 1:
-					# instruction table
-					element = left_aligned_table(element)
-				else:
-					heading = self.__title_stack[-1]
-					if heading.startswith("instruction operand encoding"):
-						# operands encoding
-						element = center_aligned_table(element)
-					elif isinstance(element, SingleCellTable):
-						element = left_aligned_table(element)
-						attributes["class"] = "exception-table"
+			element, attributes = self.__table_layout(element)
 			
 			result.append(OpenTag("table", attributes=attributes))
 			for row in range(0, element.rows()):
@@ -457,15 +785,15 @@ class x86ManParser(object):
 						if len(children) == 1:
 							contents = self.__output_text(children[0])
 							if contents.tokens[0].tag != "p":
-								contents.tokens = contents.tokens[1:-1]
+								contents.unwrap()
 								cell_tag = "th"
 							else:
 								tok = contents.tokens[1]
-								if hasattr(tok, "tag") and tok.tag == "strong":
-									contents.tokens = contents.tokens[2:-2]
+								if isinstance(tok, OpenTag) and tok.tag == "strong":
+									contents.unwrap(2)
 									cell_tag = "th"
 								else:
-									contents.tokens = contents.tokens[1:-1]
+									contents.unwrap()
 						else:
 							for child in children:
 								contents.append(self.__output_html(child))
@@ -484,9 +812,26 @@ class x86ManParser(object):
 		assert False
 		return HtmlText()
 	
+	# single-cell tables are split into rows and columns by their text
+	def __table_layout(self, element):
+		attributes = {}
+		if element.rows() == 1 and element.columns() == 1:
+			if len(self.__title_stack) == 1:
+				# instruction table
+				element = left_aligned_table(element)
+			else:
+				heading = self.__title_stack[-1]
+				if heading.startswith("instruction operand encoding"):
+					# operands encoding
+					element = center_aligned_table(element)
+				elif isinstance(element, SingleCellTable):
+					element = left_aligned_table(element)
+					attributes["class"] = "exception-table"
+		return element, attributes
+	
 	def __output_svg(self, element):
 		self_bounds = element.bounds()
-		attributes = {"x": self_bounds.x1(), "y": self_bounds.y1()}
+		attributes = {"x": self_bounds.x1, "y": self_bounds.y1}
 		result = HtmlText()
 		if isinstance(element, CharCollection):
 			# for now, let's assume that any figure text is plain text
@@ -520,44 +865,47 @@ class x86ManParser(object):
 		assert False
 		return result
 	
-	def __output_text(self, element):
-		if len(element.chars) == 0: return ""
-		
-		style = FontStyle(element.chars[0])
-		style0 = style
-		text = HtmlText()
-		open = OpenTag("p")
-		strong = False
+	# (tag, strong, indent) for a line of text: headings by font size and
+	# position, bold paragraphs, and indented code in "Operation" sections
+	def __text_tag(self, element):
 		if element.font_name() == "NeoSansIntelMedium":
-			if element.font_size() >= 12: open.tag = "h1"
+			if element.font_size() >= 12: return ("h1", False, 0)
 			elif element.font_size() >= 9.9:
-				if element.bounds().x1() < 50: open.tag = "h2"
-				else: open.tag = "h3"
+				if element.bounds().x1 < 50: return ("h2", False, 0)
+				else: return ("h3", False, 0)
 			else:
-				strong = True
+				return ("p", True, 0)
 		elif element.font_name() == "NeoSansIntel" and self.__title_stack[-1] == "operation":
-			open = OpenTag("pre", True)
-			indent = int((element.bounds().x1() - 45) / 3.375)
-			element.chars = [FakeChar(' ')] * indent + element.chars
+			return ("pre", False, int((element.bounds().x1 - 45) / 3.375))
+		return ("p", False, 0)
+	
+	def __output_text(self, element):
+		if len(element) == 0: return ""
+		
+		style = element.first_style()
+		style0 = style
+		text = HtmlText()
+		kind, strong, indent = self.__text_tag(element)
+		open = OpenTag(kind, kind == "pre")
+		if kind == "pre":
+			element.prepend_spaces(indent)
 		
 		text.append(open)
-		if strong or style.font_is("Bold"): text.append(OpenTag("strong"))
-		if style.font_is("Italic"): text.append(OpenTag("em"))
+		if strong or style.bold: text.append(OpenTag("strong"))
+		if style.italic: text.append(OpenTag("em"))
 		
-		for char in element.chars:
-			string = char.get_text()
+		# runs that do not change any tag are written out as one string
+		pending = []
+		for this_style, string in element.style_runs():
 			open = []
 			close = []
-			if hasattr(char, "fontname") and hasattr(char, "matrix"):
-				this_style = FontStyle(char)
-				this_italic = this_style.font_is("Italic")
-				if this_italic != style.font_is("Italic"):
-					if this_italic: open.append(OpenTag("em"))
+			if this_style != None and this_style is not style:
+				if this_style.italic != style.italic:
+					if this_style.italic: open.append(OpenTag("em"))
 					else: close.append(CloseTag("em"))
 				
-				this_bold = this_style.font_is("Bold")
-				if this_bold != style.font_is("Bold"):
-					if this_bold: open.append(OpenTag("strong"))
+				if this_style.bold != style.bold:
+					if this_style.bold: open.append(OpenTag("strong"))
 					else: close.append(CloseTag("strong"))
 				
 				baseline = this_style.compare_baseline(style)
@@ -565,14 +913,142 @@ class x86ManParser(object):
 					if this_style.size < style0.size: open.append(OpenTag(baseline[0]))
 					else: close.append(CloseTag(baseline[1]))
 				
+				if (len(open) > 0 or len(close) > 0) and len(pending) > 0:
+					self.__append_linked(text, "".join(pending), kind)
+					pending = []
 				for tag in reversed(close): text.append(tag)
 				for tag in open: text.append(tag)
 				style = this_style
-					
-			text.append(string)
+			
+			pending.append(string)
+		if len(pending) > 0: self.__append_linked(text, "".join(pending), kind)
 		text.autoclose()
 		return text
 	
+	# code is left alone: its AND, OR and NOT are operators
+	def __append_linked(self, text, string, kind):
+		if self.linker == None or kind == "pre" or kind[0] == "h":
+			text.append(string)
+			return
+		
+		last = 0
+		for start, end, href in self.linker.links(string, self.__page_href):
+			if start > last: text.append(string[last:start])
+			text.append(OpenTag("a", attributes={"href": href}))
+			text.append(string[start:end])
+			text.append(CloseTag("a"))
+			last = end
+		if last < len(string): text.append(string[last:])
+	
+	# One line of NDJSON per instruction, built from the same model as the
+	# HTML but without changing it.
+	def __output_json(self, displayable):
+		title_stack = self.__title_stack
+		with self.timer.stage("json"):
+			record = {"instruction": self.__title(displayable), "title": str(displayable[0]).strip(), "elements": []}
+			for element in displayable:
+				item = self.__json_element(element)
+				if item == None: continue
+				if item["type"] != "heading" and len(self.__title_stack) > 0:
+					item["section"] = self.__title_stack[-1]
+				record["elements"].append(item)
+			line = json.dumps(record, ensure_ascii=False) + "\n"
+		self.__title_stack = title_stack
+		
+		# sections still in the render pool come first
+		self.__collect_renders(True)
+		self.__write_record(line, record)
+	
+	def __write_record(self, line, record=None):
+		if self.jsonOutput != None:
+			with self.timer.stage("write"):
+				self.jsonOutput.write(line)
+		if len(self.recordSinks) > 0:
+			if record == None: record = json.loads(line)
+			with self.timer.stage("index"):
+				for sink in self.recordSinks: sink.add(record)
+	
+	def __json_element(self, element):
+		if isinstance(element, CharCollection):
+			return self.__json_text(element)
+		
+		if isinstance(element, pdftable.List):
+			return {"type": "list", "items": [self.__json_element(item) for item in element.items]}
+		
+		if isinstance(element, Figure):
+			def flatten(t):
+				result = list(t.get_everything())
+				for i in t.get_everything():
+					if isinstance(i, pdftable.TableBase):
+						result += flatten(i)
+				return result
+			
+			items = []
+			for item in flatten(element.data):
+				if isinstance(item, CharCollection):
+					items.append({"type": "text", "bounds": json_rect(item.bounds()), "size": item.font_size(), "text": str(item).strip()})
+				elif isinstance(item, pdftable.TableBase):
+					items.append({"type": "rect", "bounds": json_rect(item.bounds())})
+				elif isinstance(item, pdftable.Curve):
+					items.append({"type": "path", "points": [[round(float(x), 3), round(float(y), 3)] for x, y in item.points]})
+			return {"type": "figure", "bounds": json_rect(element.bounds()), "items": items}
+		
+		if isinstance(element, pdftable.TableBase):
+			element, attributes = self.__table_layout(element)
+			table = {"type": "table", "rows": element.rows(), "columns": element.columns(), "cells": []}
+			if "class" in attributes: table["class"] = attributes["class"]
+			for col, row, colspan, rowspan, items in element.data_cells():
+				cell = {"row": row, "column": col, "rowspan": int(rowspan), "colspan": int(colspan), "header": False, "content": []}
+				# the HTML output merges the lines in place; merge copies
+				children = self.__merge_text([item.copy() for item in items])
+				if children != None:
+					if len(children) == 1:
+						# like the HTML, a lone heading in a cell does not start a section
+						tag, strong, indent = self.__text_tag(children[0])
+						cell["header"] = tag != "p" or strong or children[0].first_style().bold
+						item = self.__json_text(children[0], False)
+						if item != None: cell["content"].append(item)
+					else:
+						for child in children:
+							item = self.__json_element(child)
+							if item != None: cell["content"].append(item)
+				table["cells"].append(cell)
+			return table
+		
+		assert False
+		return None
+	
+	# A heading, paragraph or code line, as runs of text that share a style.
+	# Runs raised or lowered from the first character's baseline are
+	# superscripts or subscripts when they are also smaller than it, the test
+	# __output_text uses.
+	def __json_text(self, element, sections=True):
+		if len(element) == 0: return None
+		
+		tag, strong, indent = self.__text_tag(element)
+		style0 = element.first_style()
+		runs = []
+		for style, string in element.style_runs():
+			run = {"text": string}
+			if style != None:
+				run["font"] = style.font
+				run["size"] = style.size
+				if strong or style.bold: run["bold"] = True
+				if style.italic: run["italic"] = True
+				baseline = style.compare_baseline(style0)
+				if baseline != None and style.size < style0.size: run["script"] = baseline[0]
+			runs.append(run)
+		if indent > 0: runs[0]["text"] = " " * indent + runs[0]["text"]
+		
+		if tag[0] == "h":
+			level = int(tag[1])
+			text = "".join(run["text"] for run in runs).strip()
+			if sections:
+				self.__title_stack = self.__title_stack[0:level - 1]
+				self.__title_stack.append(text.lower())
+			return {"type": "heading", "level": level, "text": text, "runs": runs}
+		return {"type": "code" if tag == "pre" else "paragraph", "runs": runs}
+	
 	def __prepare_display(self):
 		frames = []
 		lines = []
@@ -584,37 +1060,50 @@ class x86ManParser(object):
 			else:
 				lines.append(rect)
 		
+		with self.timer.stage("group_rects"):
+			clusters = pdftable.group_rects(lines)
+		
 		orphans = []
-		while len(lines) > 0:
-			cluster = pdftable.cluster_rects(lines)
-			if len(cluster) >= 4:
-				try:
-					frames.append(pdftable.Table(cluster))
-					continue
-				except: pass
-			orphans += cluster
+		with self.timer.stage("tables"):
+			for cluster in clusters:
+				if len(cluster) >= 4:
+					try:
+						frames.append(pdftable.Table(cluster))
+						continue
+					except: pass
+				orphans += cluster
 	
-		curves = sorted(self.curves + [pdftable.Curve(o.points()) for o in orphans], cmp=sort_topdown_ltr)
-		textLines = sorted(self.textLines, cmp=sort_topdown_ltr)
+		curves = sort_topdown_ltr(self.curves + [pdftable.Curve(o.points()) for o in orphans])
+		textLines = list(self.textLines)
 	
 		# explicit tables
+		# Each line goes to the first frame that contains it. Some pages have
+		# their "NOTES" section embedded inside the table rectangle (what were
+		# you thinking, Intel?), so a frame takes nothing from the first such
+		# heading onwards.
+		frame_index = pdftable.RectIndex(frames)
+		contents = dict((table, []) for table in frames)
+		closed = set()
+		orphans = []
+		for line in textLines:
+			is_notes = None
+			for table in frame_index.containing(line.bounds()):
+				if table in closed: continue
+				if is_notes == None:
+					is_notes = line.font_name() == "NeoSansIntelMedium" and str(line).lower().startswith("notes")
+				if is_notes:
+					closed.add(table)
+					continue
+				contents[table].append(line)
+				break
+			else:
+				orphans.append(line)
+		
 		tables = []
 		for table in frames:
-			orphans = []
-			bounds = table.bounds()
-			for i in range(0, len(textLines)):
-				line = textLines[i]
-				if bounds.contains(line.bounds()):
-					# Some pages have their "NOTES" section embedded inside the
-					# table rectangle. What were you thinking, Intel?
-					if line.font_name() == "NeoSansIntelMedium" and str(line).lower().startswith("notes"):
-						orphans += textLines[i:]
-						break
-					table.get_at_pixel(line.rect.xmid(), line.rect.ymid()).append(line)
-				else:
-					orphans.append(line)
-			textLines = orphans
+			table.add_at_pixels(contents[table], lambda line: (line.rect.xmid(), line.rect.ymid()))
 			tables.append(table)
+		textLines = orphans
 	
 		# exception tables
 		orphans = []
@@ -637,7 +1126,7 @@ class x86ManParser(object):
 				continue
 		
 			if is_table_section:
-				if line.bounds().x1() > 50:
+				if line.bounds().x1 > 50:
 					table_data.append(line)
 				elif expected_format.search(str(line)) == None:
 					orphans.append(line)
@@ -653,43 +1142,27 @@ class x86ManParser(object):
 			tables.append(SingleCellTable(table_data))
 		
 		# tables versus figures (versus useless frames)
-		all_tables = sorted(tables, key=lambda x: x.bounds().area())
-		tables = set()
+		# Single-cell tables nested in another table are figure parts.
+		tree = pdftable.ContainmentTree(tables)
 		figures = set()
 		sublevel_figures = set()
-		i = 0
-		while i < len(all_tables):
-			smaller = all_tables[i]
-			if smaller.rows() != 1 or smaller.columns() != 1:
-				tables.add(smaller)
-			else:
-				j = i + 1
-				smaller_bounds = smaller.bounds()
-				while j < len(all_tables):
-					bigger = all_tables[j]
-					if bigger.bounds().contains(smaller_bounds):
-						bigger.get_at_pixel(smaller_bounds.xmid(), smaller_bounds.ymid()).append(smaller)
-						figures.add(bigger)
-						figures.add(smaller)
-						sublevel_figures.add(smaller)
-						break
-					j += 1
-				else:
-					tables.add(smaller)
-			i += 1
+		for table in tree.items:
+			bigger = tree.parent(table)
+			if bigger != None and table.rows() == 1 and table.columns() == 1:
+				bounds = table.bounds()
+				bigger.get_at_pixel(bounds.xmid(), bounds.ymid()).append(table)
+				figures.add(bigger)
+				figures.add(table)
+				sublevel_figures.add(table)
 		
-		top_figures = [Figure(t) for t in figures - sublevel_figures]
-		top_tables = list(tables - figures)
+		top_figures = [Figure(t) for t in tree.items if t in figures and t not in sublevel_figures]
+		top_tables = [t for t in tree.items if t not in figures]
 		
-		orphanCurves = []
-		for figure in top_figures:
-			for curve in curves:
-				if figure.bounds().contains(curve.bounds()):
-					figure.data.get_at(0,0).append(curve)
-				else:
-					orphanCurves.append(curve)
-			curves = orphanCurves
-			orphanCurves = []
+		figure_index = pdftable.RectIndex(top_figures)
+		for curve in curves:
+			figure = figure_index.innermost(curve.bounds())
+			if figure != None:
+				figure.data.get_at(0,0).append(curve)
 		i = 0
 		while i < len(top_tables):
 			count = top_tables[i].item_count()
@@ -698,6 +1171,8 @@ class x86ManParser(object):
 				if count == 1:
 					orphans += top_tables[i].get_at(0,0)
 				top_tables.pop(i)
+		self.timer.count("tables", len(top_tables))
+		self.timer.count("figures", len(top_figures))
 		
 		# lists
 		textLines = self.__merge_text(orphans)
@@ -707,14 +1182,14 @@ class x86ManParser(object):
 		i = 0
 		while i < len(textLines):
 			line = textLines[i]
-			if line.chars[0].get_text() == "•":
-				if len(line.chars) == 1:
+			if line.texts[0] == "•":
+				if len(line) == 1:
 					i += 1
 					line = textLines[i]
 				else:
-					for j in range(1, len(line.chars)):
-						if not line.chars[j].get_text().isspace(): break
-					line.chars = line.chars[j:]
+					for j in range(1, len(line)):
+						if not line.texts[j].isspace(): break
+					line.drop_chars(j)
 				this_list.append(line)
 			else:
 				if len(this_list) > 0:
@@ -724,5 +1199,5 @@ class x86ManParser(object):
 			i += 1
 		
 		displayable = self.__merge_text(orphans) + top_tables + top_figures
-		displayable.sort(cmp=sort_topdown_ltr)
+		sort_topdown_ltr(displayable)
 		return displayable